@@ -2,27 +2,45 @@
 from datetime import datetime, timedelta
 from uuid import uuid4
 import os
+import time
+import hashlib
+import queue
+import select
+import gzip
+import smtplib
 from functools import wraps
 
 # --- Flask-bibliotek ---
-from flask import Flask, render_template_string, request, redirect, url_for, session, flash, jsonify
+from flask import Flask, render_template_string, request, redirect, url_for, session, flash, jsonify, make_response, abort, stream_with_context
+from flask import render_template, stream_template, get_flashed_messages
 from flask_sqlalchemy import SQLAlchemy
 from flask_session import Session
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask import Response
 from flask_migrate import Migrate
+import click
+from sqlalchemy import event, func, case, literal, null, and_, or_
+from sqlalchemy.engine import Engine
+from sqlalchemy.dialects import postgresql, sqlite
 
 # --- Flask-Login (för användarhantering) ---
 from flask_mail import Mail, Message
 from itsdangerous import URLSafeTimedSerializer
 
-from threading import Thread  # Ersätter RQ
+from threading import Thread, Lock, Event  # Ersätter RQ
+from collections import Counter, OrderedDict
 
 from twilio.rest import Client
 import math
+import sqlite3
 
 import json
 
+try:
+    import numpy as np
+except ImportError:  # NumPy är valfritt — batch-poängsättningen har en ren Python-väg
+    np = None
+
 from flask_apscheduler import APScheduler
 
 from groq import Groq
@@ -130,9 +148,63 @@ app.config['SECRET_KEY'] = SECRET_KEY
 app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', f'sqlite:///{DATABASE}')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# Översikten rankar och kapar topp-50 i databasen (False = rankning i Python)
+app.config['DASHBOARD_SQL_RANKING'] = os.environ.get('DASHBOARD_SQL_RANKING', 'True') == 'True'
+app.config['DASHBOARD_PAGE_SIZE'] = int(os.environ.get('DASHBOARD_PAGE_SIZE', 50))
+# Färdigräknade översikter cachas per användare; poängen driver med tiden så de får en TTL
+app.config['DASHBOARD_CACHE_TTL'] = int(os.environ.get('DASHBOARD_CACHE_TTL', 60))
+app.config['DASHBOARD_CACHE_SIZE'] = int(os.environ.get('DASHBOARD_CACHE_SIZE', 5000))
+# Räkna ut översikten i bakgrunden vid inloggning; första sidvisningen väntar högst så här länge på den
+app.config['DASHBOARD_PRECOMPUTE_ON_LOGIN'] = os.environ.get('DASHBOARD_PRECOMPUTE_ON_LOGIN', 'True') == 'True'
+app.config['DASHBOARD_PRECOMPUTE_WAIT'] = float(os.environ.get('DASHBOARD_PRECOMPUTE_WAIT', 2))
+# Hinner översikten inte räknas om inom tidsgränsen visas den senast uträknade (högst så här gammal)
+# medan en omräkning fortsätter i bakgrunden
+app.config['DASHBOARD_STALE_WHILE_REVALIDATE'] = os.environ.get('DASHBOARD_STALE_WHILE_REVALIDATE', 'True') == 'True'
+app.config['DASHBOARD_FRESH_DEADLINE'] = float(os.environ.get('DASHBOARD_FRESH_DEADLINE', 1))
+app.config['DASHBOARD_STALE_MAX_AGE'] = int(os.environ.get('DASHBOARD_STALE_MAX_AGE', 3600))
+# Skyddar /metrics om satt (skicka ?token=...)
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
+# Utgångna uppgifter rensas av ett schemalagt jobb, inte i requests
+app.config['EXPIRED_PURGE_GRACE_DAYS'] = int(os.environ.get('EXPIRED_PURGE_GRACE_DAYS', 1))
+app.config['EXPIRED_PURGE_BATCH_SIZE'] = int(os.environ.get('EXPIRED_PURGE_BATCH_SIZE', 500))
+app.config['EXPIRED_PURGE_INTERVAL_MINUTES'] = int(os.environ.get('EXPIRED_PURGE_INTERVAL_MINUTES', 15))
+# Skickade påminnelser sparas i batchar om så här många rader, en commit per batch
+app.config['NOTIFICATION_BATCH_SIZE'] = int(os.environ.get('NOTIFICATION_BATCH_SIZE', 200))
+# E-post går via tabellen email_outbox och skickas av notify_worker.py i batchar
+app.config['EMAIL_OUTBOX_BATCH_SIZE'] = int(os.environ.get('EMAIL_OUTBOX_BATCH_SIZE', 50))
+app.config['EMAIL_OUTBOX_LEASE_SECONDS'] = int(os.environ.get('EMAIL_OUTBOX_LEASE_SECONDS', 300))
+app.config['EMAIL_OUTBOX_MAX_ATTEMPTS'] = int(os.environ.get('EMAIL_OUTBOX_MAX_ATTEMPTS', 5))
+app.config['EMAIL_OUTBOX_POLL_INTERVAL'] = float(os.environ.get('EMAIL_OUTBOX_POLL_INTERVAL', 5))
+app.config['EMAIL_OUTBOX_RETENTION_DAYS'] = int(os.environ.get('EMAIL_OUTBOX_RETENTION_DAYS', 7))
+# Så här ofta köar `notify_worker.py --loop` påminnelser och rensar gamla mejl
+app.config['NOTIFY_INTERVAL_SECONDS'] = int(os.environ.get('NOTIFY_INTERVAL_SECONDS', 300))
+# Högst så många uppgifter per sida i en påminnelsekörning (sidorna hämtas tills inga fler är på tur)
+app.config['NOTIFICATION_PAGE_SIZE'] = int(os.environ.get('NOTIFICATION_PAGE_SIZE', 500))
+# Översikten visar bara objekt med deadline/start inom så här många dagar (0 = ingen gräns)
+app.config['DASHBOARD_HORIZON_DAYS'] = int(os.environ.get('DASHBOARD_HORIZON_DAYS', 365))
+# Stora sidor (översikt, klass, ämne) strömmas i bitar om minst så här många tecken
+app.config['STREAM_TEMPLATES'] = os.environ.get('STREAM_TEMPLATES', 'True') == 'True'
+app.config['STREAM_CHUNK_SIZE'] = int(os.environ.get('STREAM_CHUNK_SIZE', 4096))
+# JSON-svar mindre än så här (bytes) komprimeras inte
+app.config['API_GZIP_MIN_SIZE'] = int(os.environ.get('API_GZIP_MIN_SIZE', 512))
+# Arkivera aktiviteter som slutade för mer än N dagar sedan (0 = av)
+app.config['ACTIVITY_RETENTION_DAYS'] = int(os.environ.get('ACTIVITY_RETENTION_DAYS', 0))
+# Live-uppdateringar av översikten (SSE). Av som standard: varje öppen ström håller en
+# worker-tråd, så slå bara på med en asynkron workerklass (t.ex. gunicorn -k gevent).
+app.config['LIVE_FEED_ENABLED'] = os.environ.get('LIVE_FEED_ENABLED', 'False') == 'True'
+app.config['FEED_POLL_INTERVAL'] = float(os.environ.get('FEED_POLL_INTERVAL', 2))
+app.config['FEED_STREAM_HEARTBEAT'] = int(os.environ.get('FEED_STREAM_HEARTBEAT', 25))
+app.config['FEED_CHANGE_RETENTION_MINUTES'] = int(os.environ.get('FEED_CHANGE_RETENTION_MINUTES', 60))
+
+# Schemalagda jobb (rensning, arkivering) får bara köras i en process. notify_worker.py kör
+# dem (--loop via schemaläggaren, annars vid varje cron-körning); sätt SCHEDULER_ENABLED=True
+# i högst en webbprocess om ingen worker körs.
+app.config['SCHEDULER_ENABLED'] = os.environ.get('SCHEDULER_ENABLED', 'False') == 'True'
+
 scheduler = APScheduler()
 scheduler.init_app(app)
-scheduler.start()
+if app.config['SCHEDULER_ENABLED']:
+    scheduler.start()
 
 # Session
 app.config['SESSION_TYPE'] = 'sqlalchemy'
@@ -152,9 +224,19 @@ app.config['MAIL_USE_SSL'] = os.environ.get('MAIL_USE_SSL') == 'True'
 app.config['MAIL_USERNAME'] = os.environ.get('MAIL_USERNAME')
 app.config['MAIL_PASSWORD'] = os.environ.get('MAIL_PASSWORD')
 app.config['MAIL_DEFAULT_SENDER'] = os.environ.get('MAIL_DEFAULT_SENDER')
+# Utskick i batch delar en SMTP-anslutning; Flask-Mail kopplar upp på nytt efter så här många mejl
+app.config['MAIL_MAX_EMAILS'] = int(os.environ.get('MAIL_MAX_EMAILS', 100))
 
 mail = Mail(app)
 
+# SQLite saknar sqrt/power i många byggen — registrera dem så att
+# prioriteringsuttrycken i SQL fungerar likadant som på Postgres
+@event.listens_for(Engine, 'connect')
+def _register_sqlite_functions(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        dbapi_connection.create_function('sqrt', 1, lambda x: None if x is None else math.sqrt(x))
+        dbapi_connection.create_function('power', 2, lambda x, y: None if x is None or y is None else math.pow(x, y))
+
 # Serializer för token
 serializer = URLSafeTimedSerializer(app.config['SECRET_KEY'])
 
@@ -200,6 +282,8 @@ class Subject(db.Model):
     class_id = db.Column(db.Integer, db.ForeignKey('classes.id'), nullable=False)
     name = db.Column(db.String, nullable=False)
     weight = db.Column(db.String(50), default="100p")
+    # Vikten som tal (W i poängmodellerna), satt från weight via weight_factor_for()
+    weight_factor = db.Column(db.Float, nullable=False, default=2.0, server_default='2')
     cls = db.relationship('Class', back_populates='subjects')
     assignments = db.relationship('Assignment', back_populates='subject', cascade="all, delete-orphan")
     skills = db.relationship('SubjectSkill', backref='subject', cascade="all, delete-orphan")
@@ -210,10 +294,12 @@ class Assignment(db.Model):
     subject_id = db.Column(db.Integer, db.ForeignKey('subjects.id'), nullable=False)
     title = db.Column(db.String, nullable=False)
     type = db.Column(db.String, nullable=False)  # ex: 'uppgift' eller 'prov'
-    deadline = db.Column(db.DateTime)
+    deadline = db.Column(db.DateTime, index=True)
     created_by = db.Column(db.Integer, db.ForeignKey('users.id'))
     subject = db.relationship('Subject', back_populates='assignments')
     sent_notifications = db.Column(db.String, default="")
+    # När nästa påminnelsefönster börjar (NULL = inga fler), satt via next_notify_at()
+    next_notify_at = db.Column(db.DateTime, index=True)
 
 class AssignmentNotification(db.Model):
     __tablename__ = "assignment_notifications"
@@ -255,98 +341,427 @@ class Activity(db.Model):
     # Relationship
     user = db.relationship('User', backref=db.backref('activities', lazy=True))
 
+class ActivityArchive(db.Model):
+    """Aktiviteter som flyttats bort av archive_past_activities() (samma kolumner som activity)."""
+    __tablename__ = 'activity_archive'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False, index=True)
+    name = db.Column(db.String(255), nullable=False)
+    start_time = db.Column(db.DateTime, nullable=False)
+    end_time = db.Column(db.DateTime, nullable=False)
+    archived_at = db.Column(db.DateTime, default=datetime.now, nullable=False)
+
 class SubjectSkill(db.Model):
     __tablename__ = 'subject_skill'
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     subject_id = db.Column(db.Integer, db.ForeignKey('subjects.id'), nullable=False)
     level = db.Column(db.String(20), default='Ej vald')
+    # Svårighetsfaktorn (S i poängmodellerna), satt från level via skill_factor_for()
+    skill_factor = db.Column(db.Float, nullable=False, default=1.5, server_default='1.5')
 
-# ---------- Auth helpers ----------
-def check_days_left_threshold(user, assignment):
-    if not assignment.deadline:
-        return
+class UserFeedItem(db.Model):
+    """Denormaliserad rad per (användare, objekt) som översikten läser direkt.
 
-    thresholds = [14, 7, 3, 1]
-    days_left = compute_days_left(assignment.deadline)
+    Hålls uppdaterad av skrivvägarna via sync_user_feed() och kan byggas om
+    från grunden med `flask rebuild-user-feed`.
+    """
+    __tablename__ = 'user_feed'
 
-    if days_left not in thresholds:
-        return
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    kind = db.Column(db.String(20), nullable=False)  # 'assignment' eller 'activity'
+    item_id = db.Column(db.Integer, nullable=False)
+    title = db.Column(db.String, nullable=False)
+    due = db.Column(db.DateTime)  # deadline för uppgifter, starttid för aktiviteter
+    end_time = db.Column(db.DateTime)
+    subject_id = db.Column(db.Integer)
+    subject_name = db.Column(db.String)
+    class_id = db.Column(db.Integer)
+    class_name = db.Column(db.String)
+    created_by = db.Column(db.Integer)
+    assignment_type = db.Column(db.String)
+    role = db.Column(db.String(20))
+    weight = db.Column(db.Float, nullable=False, default=1.0)
+    skill_factor = db.Column(db.Float, nullable=False, default=1.0)
 
-    # Check if this user already received this threshold
-    already_sent = AssignmentNotification.query.filter_by(
-        assignment_id=assignment.id,
-        user_id=user.id,
-        days_left=days_left
-    ).first()
-    
-    if already_sent:
-        return  # already sent to this user
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'kind', 'item_id', name='_user_feed_item_uc'),
+        db.Index('ix_user_feed_user_due', 'user_id', 'due'),
+        db.Index('ix_user_feed_class', 'class_id'),
+        db.Index('ix_user_feed_subject', 'subject_id'),
+    )
 
-    # Send the email
-    subject = f"Påminnelse: {assignment.title}"
-    body = f"Hej {user.name}, det är nu {days_left + 1} dagar kvar för '{assignment.title}'. Länk: truetime.onrender.com"
+class DataVersion(db.Model):
+    """Versionsräknare per 'user:<id>' / 'class:<id>' som skrivvägarna räknar upp."""
+    __tablename__ = 'data_versions'
 
-    mail.send_message(
-        subject=subject,
-        recipients=[user.email],
-        body=body
+    key = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+class FeedChange(db.Model):
+    """Ändringslogg för live-uppdateringar; läses av FeedChangeHub i varje worker."""
+    __tablename__ = 'feed_changes'
+
+    id = db.Column(db.Integer, primary_key=True)
+    class_id = db.Column(db.Integer, nullable=False)
+    kind = db.Column(db.String(20), nullable=False)
+    item_id = db.Column(db.Integer, nullable=False)
+    op = db.Column(db.String(10), nullable=False)  # 'upsert' eller 'delete'
+    created_at = db.Column(db.DateTime, default=datetime.now, nullable=False, index=True)
+
+class EmailOutbox(db.Model):
+    """Mejl som väntar på att skickas; requests och jobb lägger bara in rader här.
+
+    notify_worker.py gör anspråk på rader genom att sätta claimed_by och
+    locked_until (en lease). Dör workern mitt i en batch går leasen ut och
+    raderna skickas av nästa.
+    """
+    __tablename__ = 'email_outbox'
+
+    id = db.Column(db.Integer, primary_key=True)
+    recipient = db.Column(db.String, nullable=False)
+    subject = db.Column(db.String, nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(10), nullable=False, default='pending')  # 'pending', 'sent' eller 'failed'
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.String)
+    claimed_by = db.Column(db.String(32))
+    locked_until = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    sent_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_email_outbox_status_id', 'status', 'id'),
     )
 
-    # Record the notification
-    new_record = AssignmentNotification(
-        assignment_id=assignment.id,
-        user_id=user.id,
-        days_left=days_left
+# ---------- Auth helpers ----------
+NOTIFICATION_THRESHOLDS = (14, 7, 3, 1)  # dagar kvar då en påminnelse skickas, störst först
+
+def next_notify_at(deadline, now, include_current=True):
+    """Början på nästa tröskelfönster för en deadline, eller None om inga påminnelser återstår.
+
+    Fönstret för tröskeln d är de tider då compute_days_left() ger d, d.v.s.
+    (deadline - d - 1 dagar, deadline - d dagar]; det är öppet i början, så en
+    uppgift är på tur först när next_notify_at < now. Med include_current
+    räknas ett fönster som redan börjat (men inte tagit slut) med, annars
+    bara fönster som inte hunnit börja.
+    """
+    if deadline is None:
+        return None
+    for days in NOTIFICATION_THRESHOLDS:
+        start = deadline - timedelta(days=days + 1)
+        end = deadline - timedelta(days=days)
+        if (end >= now) if include_current else (start >= now):
+            return start
+    return None
+
+def send_over(connection, msg):
+    """Skickar msg över en öppen mail.connect()-anslutning; tappas den kopplar vi upp igen en gång."""
+    try:
+        connection.send(msg)
+    except smtplib.SMTPServerDisconnected:
+        connection.host = connection.configure_host()
+        connection.num_emails = 0
+        connection.send(msg)
+
+def deadline_notification_email(due):
+    """email_outbox-rad för en påminnelse, från en rad ur deadline_notification_candidates()."""
+    subject = f"Påminnelse: {due.title}"
+    body = f"Hej {due.name}, det är nu {due.days_left + 1} dagar kvar för '{due.title}'. Länk: truetime.onrender.com"
+    return {'recipient': due.email, 'subject': subject, 'body': body,
+            'status': 'pending', 'attempts': 0, 'created_at': datetime.utcnow()}
+
+def notification_days_left(now):
+    """SQL-uttryck: tröskeln vars fönster deadline ligger i (samma avrundning som compute_days_left()), annars NULL."""
+    return case(*[
+        (and_(Assignment.deadline >= now + timedelta(days=days),
+              Assignment.deadline < now + timedelta(days=days + 1)), days)
+        for days in NOTIFICATION_THRESHOLDS
+    ])
+
+def deadline_notification_candidates(now, assignment_ids=None):
+    """Påminnelser som är på tur och inte redan skickats, som rader
+    (assignment_id, title, user_id, name, email, days_left).
+
+    Uppgifter i ett tröskelfönster, klassmedlemmar med notiser påslagna och
+    redan skickade AssignmentNotification-rader bortdragna, i en fråga. Bara
+    kolumner hämtas, så batchernas commit laddar inte om några objekt.
+    """
+    days_left = notification_days_left(now)
+    already_sent = db.exists().where(
+        AssignmentNotification.assignment_id == Assignment.id,
+        AssignmentNotification.user_id == User.id,
+        AssignmentNotification.days_left == days_left,
     )
-    db.session.add(new_record)
+    stmt = (
+        db.select(
+            Assignment.id.label('assignment_id'), Assignment.title,
+            User.id.label('user_id'), User.name, User.email,
+            days_left.label('days_left'),
+        )
+        .join(Subject, Subject.id == Assignment.subject_id)
+        .join(ClassMember, ClassMember.class_id == Subject.class_id)
+        .join(User, User.id == ClassMember.user_id)
+        .where(days_left != None, User.notifications_enabled == True, ~already_sent)
+        .order_by(Assignment.id, User.id)
+    )
+    if assignment_ids is not None:
+        stmt = stmt.where(Assignment.id.in_(assignment_ids))
+    return db.session.execute(stmt).all()
+
+def record_sent_notifications(rows, emails):
+    """Sparar påminnelser och deras mejl i email_outbox i samma commit.
+
+    Dubbletter (t.ex. från en parallell körning) hoppas över, och då läggs
+    inte heller deras mejl i kö.
+    """
+    dialect_insert = postgresql.insert if db.engine.dialect.name == 'postgresql' else sqlite.insert
+    inserted = db.session.execute(
+        dialect_insert(AssignmentNotification).on_conflict_do_nothing(
+            index_elements=['assignment_id', 'user_id', 'days_left']
+        ).returning(AssignmentNotification.assignment_id, AssignmentNotification.user_id,
+                    AssignmentNotification.days_left),
+        rows
+    ).all()
+    new = {tuple(row) for row in inserted}
+    queued = [email for row, email in zip(rows, emails)
+              if (row['assignment_id'], row['user_id'], row['days_left']) in new]
+    if queued:
+        db.session.execute(db.insert(EmailOutbox), queued)
     db.session.commit()
+    return len(queued)
+
+def send_deadline_notifications(batch_size=None, page_size=None):
+    """Lägger påminnelser för uppgifter vars next_notify_at har passerats i email_outbox.
+
+    Arbetet växer med antalet påminnelser på tur, inte med tabellernas storlek:
+    uppgifterna hämtas via indexet på next_notify_at och flyttas fram till
+    nästa fönster. Själva utskicket gör send_outbox_batch(). Returnerar antal
+    köade påminnelser.
+    """
+    batch_size = batch_size or app.config['NOTIFICATION_BATCH_SIZE']
+    page_size = page_size or app.config['NOTIFICATION_PAGE_SIZE']
+    now = datetime.now()
+    queued = 0
+
+    while True:
+        due_assignments = db.session.execute(
+            db.select(Assignment.id, Assignment.deadline)
+            .where(Assignment.next_notify_at < now)
+            .order_by(Assignment.next_notify_at)
+            .limit(page_size)
+        ).all()
+        if not due_assignments:
+            break
+
+        rows, emails = [], []
+        for due in deadline_notification_candidates(now, [row.id for row in due_assignments]):
+            rows.append({'assignment_id': due.assignment_id, 'user_id': due.user_id,
+                         'days_left': due.days_left, 'sent_at': datetime.utcnow()})
+            emails.append(deadline_notification_email(due))
+            if len(rows) >= batch_size:
+                queued += record_sent_notifications(rows, emails)
+                rows, emails = [], []
+        if rows:
+            queued += record_sent_notifications(rows, emails)
+
+        # Fönster som passerat utan att någon var på tur (t.ex. när jobbet stått still) hoppas över
+        db.session.execute(db.update(Assignment), [
+            {'id': row.id, 'next_notify_at': next_notify_at(row.deadline, now, include_current=False)}
+            for row in due_assignments
+        ])
+        db.session.commit()
+        if len(due_assignments) < page_size:
+            break
 
-def send_deadline_notifications():
-    assignments = Assignment.query.all()  # fetch all assignments
-
-    for a in assignments:
-        if not a.deadline:
-            continue
+    METRICS['deadline_notifications_queued'] += queued
+    return queued
 
-        # Loop through all class members of the assignment's subject
-        for uc in a.subject.cls.members:
-            user = uc.user
+def enqueue_email(recipient, subject, body):
+    """Lägger ett mejl i email_outbox (anroparen committar, så mejlet följer med transaktionen)."""
+    db.session.add(EmailOutbox(recipient=recipient, subject=subject, body=body))
 
-            # Only send notification if the user has notifications enabled
-            if user.notifications_enabled:
-                check_days_left_threshold(user, a)
+def claim_outbox_batch(limit=None, lease_seconds=None):
+    """Gör anspråk på upp till `limit` väntande mejl åt den här workern och committar.
 
-def delete_expired_assignments():
+    Postgres låser kandidaterna med FOR UPDATE SKIP LOCKED så att parallella
+    workers tar olika rader; SQLite serialiserar skrivningar, så där räcker
+    UPDATE:en. I båda fallen skyddar locked_until raderna medan de skickas.
+    """
+    limit = limit or app.config['EMAIL_OUTBOX_BATCH_SIZE']
+    lease_seconds = lease_seconds or app.config['EMAIL_OUTBOX_LEASE_SECONDS']
     now = datetime.utcnow()
-
-    expired_assignments = Assignment.query.filter(
-        Assignment.deadline != None,
-        Assignment.deadline < now
+    claim = uuid4().hex
+
+    available = (
+        db.select(EmailOutbox.id)
+        .where(EmailOutbox.status == 'pending',
+               or_(EmailOutbox.locked_until == None, EmailOutbox.locked_until < now))
+        .order_by(EmailOutbox.id)
+        .limit(limit)
+    )
+    if db.engine.dialect.name == 'postgresql':
+        ids = db.session.scalars(available.with_for_update(skip_locked=True)).all()
+        claimed = EmailOutbox.id.in_(ids)
+    else:
+        claimed = EmailOutbox.id.in_(available.scalar_subquery())
+    db.session.execute(
+        db.update(EmailOutbox).where(claimed)
+        .values(claimed_by=claim, locked_until=now + timedelta(seconds=lease_seconds))
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return db.session.scalars(
+        db.select(EmailOutbox).where(EmailOutbox.claimed_by == claim).order_by(EmailOutbox.id)
     ).all()
 
-    for assignment in expired_assignments:
-        db.session.delete(assignment)
+def send_outbox_batch():
+    """Skickar en batch ur email_outbox över en SMTP-anslutning. Returnerar antal skickade.
+
+    Misslyckade mejl försöks igen med växande väntetid tills
+    EMAIL_OUTBOX_MAX_ATTEMPTS, sedan markeras de 'failed'.
+    """
+    emails = claim_outbox_batch()
+    if not emails:
+        return 0
+
+    sent, failed = [], []
+    try:
+        with mail.connect() as connection:
+            for email in emails:
+                try:
+                    send_over(connection, Message(email.subject, recipients=[email.recipient], body=email.body))
+                    sent.append(email)
+                except Exception as e:
+                    failed.append((email, e))
+    except Exception as e:
+        # Uppkopplingen misslyckades: resten av batchen räknas som misslyckad
+        done = {email.id for email in sent} | {email.id for email, _ in failed}
+        failed += [(email, e) for email in emails if email.id not in done]
 
+    now = datetime.utcnow()
+    for email in sent:
+        email.status, email.sent_at, email.locked_until = 'sent', now, None
+    for email, error in failed:
+        print(f"Kunde inte skicka mejl till {email.recipient}: {error}")
+        email.attempts += 1
+        email.last_error = str(error)[:500]
+        if email.attempts >= app.config['EMAIL_OUTBOX_MAX_ATTEMPTS']:
+            email.status, email.locked_until = 'failed', None
+        else:
+            email.locked_until = now + timedelta(minutes=2 ** email.attempts)
     db.session.commit()
 
-def send_async_email(app, msg):
-    """Hjälpfunktion för att skicka mejl utanför huvudtråden"""
-    with app.app_context():
-        try:
-            mail.send(msg)
-        except Exception as e:
-            print(f"Mejlfel i bakgrundstråd: {e}")
+    METRICS['emails_sent'] += len(sent)
+    METRICS['emails_failed'] += len(failed)
+    return len(sent)
+
+def drain_outbox():
+    """Skickar batchar tills inget väntande mejl finns kvar. Returnerar antal skickade."""
+    total = 0
+    while True:
+        sent = send_outbox_batch()
+        if not sent:
+            return total
+        total += sent
+
+def prune_outbox(retention_days=None):
+    """Tar bort skickade mejl äldre än EMAIL_OUTBOX_RETENTION_DAYS."""
+    retention_days = app.config['EMAIL_OUTBOX_RETENTION_DAYS'] if retention_days is None else retention_days
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    db.session.execute(db.delete(EmailOutbox).where(EmailOutbox.status == 'sent', EmailOutbox.sent_at < cutoff))
+    db.session.commit()
+
+def purge_expired_assignments(grace_days=None, batch_size=None):
+    """Raderar utgångna uppgifter med mängdbaserade DELETE i begränsade batchar.
+
+    Bara uppgifter vars deadline passerade för mer än `grace_days` dagar sedan
+    rensas; översikten filtrerar redan bort utgångna rader i sin fråga.
+    Returnerar {'purged': antal, 'seconds': tid}.
+    """
+    grace_days = app.config['EXPIRED_PURGE_GRACE_DAYS'] if grace_days is None else grace_days
+    batch_size = batch_size or app.config['EXPIRED_PURGE_BATCH_SIZE']
+    cutoff = datetime.now() - timedelta(days=grace_days)
+    start = time.perf_counter()
+    purged = 0
+
+    while True:
+        ids = db.session.scalars(
+            db.select(Assignment.id)
+            .where(Assignment.deadline != None, Assignment.deadline < cutoff)
+            .order_by(Assignment.id)
+            .limit(batch_size)
+        ).all()
+        if not ids:
+            break
+
+        class_ids = db.session.scalars(
+            db.select(Subject.class_id).distinct()
+            .join(Assignment, Assignment.subject_id == Subject.id)
+            .where(Assignment.id.in_(ids))
+        ).all()
+
+        db.session.execute(db.delete(AssignmentNotification).where(AssignmentNotification.assignment_id.in_(ids)))
+        db.session.execute(db.delete(UserFeedItem).where(UserFeedItem.kind == 'assignment', UserFeedItem.item_id.in_(ids)))
+        db.session.execute(db.delete(Assignment).where(Assignment.id.in_(ids)))
+        # Ämnessidorna visar utgångna uppgifter tills de rensas
+        bump_data_versions(*[class_version_key(class_id) for class_id in class_ids])
+        db.session.commit()
+        purged += len(ids)
+
+    seconds = time.perf_counter() - start
+    METRICS['expired_assignments_purged'] += purged
+    print(f"Rensade {purged} utgångna uppgifter på {seconds:.2f} s.")
+    return {'purged': purged, 'seconds': seconds}
+
+def archive_past_activities(retention_days=None, batch_size=None):
+    """Flyttar aktiviteter som slutade för mer än `retention_days` dagar sedan till activity_archive.
+
+    Översikten visar aldrig avslutade aktiviteter, så det här håller bara
+    activity-tabellen liten. Returnerar {'archived': antal, 'seconds': tid}.
+    """
+    retention_days = app.config['ACTIVITY_RETENTION_DAYS'] if retention_days is None else retention_days
+    batch_size = batch_size or app.config['EXPIRED_PURGE_BATCH_SIZE']
+    cutoff = datetime.now() - timedelta(days=retention_days)
+    start = time.perf_counter()
+    archived = 0
+
+    while True:
+        rows = db.session.execute(
+            db.select(Activity.id, Activity.user_id)
+            .where(Activity.end_time < cutoff)
+            .order_by(Activity.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+
+        ids = [row.id for row in rows]
+        columns = ('id', 'user_id', 'name', 'start_time', 'end_time')
+        db.session.execute(db.insert(ActivityArchive).from_select(
+            columns,
+            db.select(Activity.id, Activity.user_id, Activity.name, Activity.start_time, Activity.end_time)
+            .where(Activity.id.in_(ids))
+        ))
+        db.session.execute(db.delete(UserFeedItem).where(UserFeedItem.kind == 'activity', UserFeedItem.item_id.in_(ids)))
+        db.session.execute(db.delete(Activity).where(Activity.id.in_(ids)))
+        bump_data_versions(*{user_version_key(row.user_id) for row in rows})
+        db.session.commit()
+        archived += len(ids)
+
+    seconds = time.perf_counter() - start
+    METRICS['activities_archived'] += archived
+    print(f"Arkiverade {archived} avslutade aktiviteter på {seconds:.2f} s.")
+    return {'archived': archived, 'seconds': seconds}
 
 def send_email_job(user_id, subject, body):
-    """Ersätter RQ-jobbet med en tråd"""
-    # Vi behöver importera User inuti eller se till att den finns tillgänglig
-    from models import User 
-    user = User.query.get(user_id)
+    """Ersätter RQ-jobbet: lägger mejlet i email_outbox, notify_worker.py skickar det"""
+    user = db.session.get(User, user_id)
     if user:
-        msg = Message(subject, recipients=[user.email], body=body)
-        # Vi skickar med 'app' så att tråden har tillgång till konfigurationen
-        Thread(target=send_async_email, args=(app, msg)).start()
+        enqueue_email(user.email, subject, body)
+        db.session.commit()
 
 def current_user():
     uid = session.get('user_id')
@@ -373,8 +788,8 @@ def login_required(f):
     return decorated
 
 # ---------- Utils ----------
-def compute_days_left(deadline):
-    now = datetime.now()
+def compute_days_left(deadline, now=None):
+    now = now or datetime.now()
     delta = deadline - now
     return int(delta.total_seconds() // 86400)  # floor to whole days
 
@@ -382,6 +797,7 @@ def generate_join_code():
     return uuid4().hex[:6].upper()
 
 def calculate_priority_score(item, mode, user_skills):
+    # user_skills: {subject_id: SubjectSkill.skill_factor}
     # T = Dagar kvar (nuvarande tid till deadline/start)
     now = datetime.now()
     
@@ -390,18 +806,12 @@ def calculate_priority_score(item, mode, user_skills):
         delta = dt - now
         t = max(0, delta.days + (delta.seconds / 86400))
         
-        # Hämta Tyngd (W) - mappar strängar till siffervärden
-        # Vi antar att du har sparat vikt i din databasmodell för ämnet
-        weight_map = {'50p': 1, '100p': 2, '150p': 3, 'Gymnasiearbete': 4}
-        # Vi behöver hämta vikten från databasen baserat på subject_name eller liknande
-        # För enkelhetens skull i denna loop sätter vi standard till 2 (100p) om ej hittad
-        w = 2 
+        # Tyngd (W) = ämnets Subject.weight_factor
+        w = item.get('weight', DEFAULT_WEIGHT_FACTOR)
         
-        # Svårighetsfaktor (S) baserat på nivå
+        # Svårighetsfaktor (S) = användarens SubjectSkill.skill_factor
         # Låg nivå = 3 (behöver mer fokus), Hög = 1
-        skill_level = user_skills.get(item.get('subject_id'), 'Ej vald')
-        skill_map = {'Låg': 3, 'Medel': 2, 'Hög': 1, 'Ej vald': 1.5}
-        s = skill_map.get(skill_level, 1.5)
+        s = user_skills.get(item.get('subject_id'), DEFAULT_SKILL_FACTOR)
         
         if mode == 'planerare':
             # Modell 2: Score = (W*S) / (sqrt(T) + 1)
@@ -417,12 +827,1004 @@ def calculate_priority_score(item, mode, user_skills):
         # Aktiviteter har en fast "vikt" så de flyter med naturligt
         return 1.8 / (t + 1)
 
+# ---------- Batch-poängsättning ----------
+ITEM_KIND_ASSIGNMENT = 0
+ITEM_KIND_ACTIVITY = 1
+
+def score_batch(deadlines, weights, skill_factors, kinds, mode, now=None):
+    """Poängsätter många objekt i ett svep med samma modeller som calculate_priority_score().
+
+    Alla argument är kolumner av samma längd: deadlines i epoch-sekunder
+    (NaN = ingen deadline), vikter, svårighetsfaktorer och ITEM_KIND_*.
+    Ett enda "nu" används för hela batchen. Med NumPy returneras en
+    ndarray, annars en lista.
+    """
+    now_ts = (now or datetime.now()).timestamp()
+
+    if np is None:
+        return _score_batch_python(deadlines, weights, skill_factors, kinds, mode, now_ts)
+
+    deadlines = np.asarray(deadlines, dtype=np.float64)
+    weights = np.asarray(weights, dtype=np.float64)
+    skill_factors = np.asarray(skill_factors, dtype=np.float64)
+    kinds = np.asarray(kinds, dtype=np.int8)
+
+    # T = dagar kvar, aldrig negativt
+    t = np.maximum(0.0, (deadlines - now_ts) / 86400.0)
+    ws = weights * skill_factors
+    if mode == 'planerare':
+        assignment_scores = ws / (np.sqrt(t) + 1)
+    else:
+        assignment_scores = ws / np.power(t + 1, 1.5)
+
+    scores = np.where(kinds == ITEM_KIND_ACTIVITY, 1.8 / (t + 1), assignment_scores)
+    # Saknad deadline (NaN) hamnar sist, precis som datetime.max i den gamla vägen
+    return np.nan_to_num(scores, nan=0.0)
+
+def _score_batch_python(deadlines, weights, skill_factors, kinds, mode, now_ts):
+    scores = []
+    for deadline, w, s, kind in zip(deadlines, weights, skill_factors, kinds):
+        if deadline is None or deadline != deadline:  # None eller NaN
+            scores.append(0.0)
+            continue
+        t = max(0.0, (deadline - now_ts) / 86400.0)
+        if kind == ITEM_KIND_ACTIVITY:
+            scores.append(1.8 / (t + 1))
+        elif mode == 'planerare':
+            scores.append((w * s) / (math.sqrt(t) + 1))
+        else:
+            scores.append((w * s) / ((t + 1) ** 1.5))
+    return scores
+
 # En enkel mappning för att hjälpa AI:n
 def get_actual_page_mapping(pdf_page_index):
     # Om bokens "Sida 1" är PDF-sida 7, är offseten 6.
     offset = 2 
     return pdf_page_index - offset
 
+# ---------- Dashboard-flöde ----------
+SKILL_FACTORS = {'Låg': 3, 'Medel': 2, 'Hög': 1, 'Ej vald': 1.5}
+DEFAULT_SKILL_FACTOR = 1.5
+SUBJECT_WEIGHT_FACTORS = {'50p': 1, '100p': 2, '150p': 3, 'Gymnasiearbete': 4}
+DEFAULT_WEIGHT_FACTOR = 2.0  # som 100p, även för "Ingen vikt"
+
+def weight_factor_for(weight):
+    """Subject.weight ("100p", "Gymnasiearbete", ...) som tal för Subject.weight_factor."""
+    return float(SUBJECT_WEIGHT_FACTORS.get(weight, DEFAULT_WEIGHT_FACTOR))
+
+def skill_factor_for(level):
+    """SubjectSkill.level ("Låg", "Medel", ...) som tal för SubjectSkill.skill_factor."""
+    return float(SKILL_FACTORS.get(level, DEFAULT_SKILL_FACTOR))
+
+EXAM_TYPES = ('Prov', 'exam')
+DASHBOARD_MODES = ('sista_minuten', 'planerare')
+SKIPPED_SKILL_LEVEL = 'Läser ej'
+
+# Synlighetsregler för översikten, som SQL-villkor så att bara levande rader lämnar databasen
+def assignment_visible(assignment_type, deadline, now):
+    """Uppgifter syns tills deadline passerat, prov hela deadlinedagen; utan deadline alltid."""
+    start_of_today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    return or_(
+        deadline == None,
+        and_(assignment_type.in_(EXAM_TYPES), deadline >= start_of_today),
+        and_(assignment_type.not_in(EXAM_TYPES), deadline >= now),
+    )
+
+def activity_visible(end_time, now):
+    """Aktiviteter syns tills de är slut."""
+    return end_time >= now
+
+def within_horizon(due, now):
+    """Objekt längre bort än DASHBOARD_HORIZON_DAYS visas inte (saknad tid räknas som inom)."""
+    horizon_days = app.config['DASHBOARD_HORIZON_DAYS']
+    if not horizon_days:
+        return db.true()
+    return or_(due == None, due <= now + timedelta(days=horizon_days))
+
+def skill_followed(level):
+    """Villkor på en (ev. utejoinad) SubjectSkill.level: ämnet är inte markerat "Läser ej"."""
+    return or_(level == None, level != SKIPPED_SKILL_LEVEL)
+
+def subject_followed(subject_id, user_id):
+    """Samma regel som skill_followed() utan join, för relationsladdning."""
+    return subject_id.not_in(
+        db.select(SubjectSkill.subject_id)
+        .where(SubjectSkill.user_id == user_id, SubjectSkill.level == SKIPPED_SKILL_LEVEL)
+    )
+
+def deadline_color(deadline, now):
+    """Färgkod för en deadline (grönt = långt bort, rött = nära, lila = passerad)."""
+    if deadline is None:
+        return "#f8f9fa"
+
+    delta = deadline - now
+    days_left = delta.days + (delta.seconds / 86400)
+    if days_left > 14:
+        return "#44ce1b"
+    elif days_left > 7:
+        return "#bbdb44"
+    elif days_left > 3:
+        return "#fad928"
+    elif days_left > 1:
+        return "#f2a134"
+    elif days_left > 0:
+        return "#e51f1f"
+    return "#6a6af7"  # overdue
+
+class FeedItem:
+    """Ett objekt i översiktens flöde — uppgift eller aktivitet.
+
+    Samma typ används av Jinja-mallarna och JSON-svaren. `__slots__` håller
+    nere minnet per objekt jämfört med en dict (se `python bench.py feed_items`).
+    """
+    __slots__ = (
+        'type', 'id', 'title', 'due', 'end_time', 'subject_id', 'subject_name',
+        'class_id', 'class_name', 'created_by', 'assignment_type', 'role', 'weight',
+        'color', 'priority_score', 'scores', 'feed_modes',
+    )
+
+    def __init__(self, kind, item_id, title, due, now, end_time=None, subject_id=None, subject_name=None,
+                 class_id=None, class_name=None, created_by=None, assignment_type=None, role=None,
+                 weight=1.0, priority_score=0.0, scores=None):
+        self.type = kind
+        self.id = item_id
+        self.title = title
+        self.due = due
+        self.end_time = end_time
+        self.subject_id = subject_id
+        self.subject_name = subject_name
+        self.class_id = class_id
+        self.class_name = class_name
+        self.created_by = created_by
+        self.assignment_type = assignment_type
+        self.weight = weight
+        self.priority_score = priority_score
+        self.scores = scores
+        self.feed_modes = None
+        if kind == 'activity':
+            self.role = 'owner'  # alltid admin för egna aktiviteter
+            self.color = '#7da0ff'
+        else:
+            self.role = role or 'member'
+            self.color = deadline_color(due, now)
+
+    # Mallarna använder deadline för uppgifter och start_time för aktiviteter
+    @property
+    def deadline(self):
+        return self.due if self.type == 'assignment' else None
+
+    @property
+    def start_time(self):
+        return self.due if self.type == 'activity' else None
+
+    @property
+    def key(self):
+        return (self.type, self.id)
+
+    def to_dict(self):
+        """JSON-form med samma nycklar som mallen läser (datum som ISO-strängar)."""
+        data = {
+            'id': self.id,
+            'type': self.type,
+            'title': self.title,
+            'role': self.role,
+            'color': self.color,
+            'priority_score': self.priority_score,
+            'scores': self.scores,
+        }
+        if self.type == 'activity':
+            data['start_time'] = self.due.isoformat() if self.due else None
+            data['end_time'] = self.end_time.isoformat() if self.end_time else None
+        else:
+            data.update({
+                'deadline': self.due.isoformat() if self.due else None,
+                'subject_name': self.subject_name,
+                'subject_id': self.subject_id,
+                'weight': self.weight,
+                'class_name': self.class_name,
+                'class_id': self.class_id,
+                'created_by': self.created_by,
+                'assignment_type': self.assignment_type,
+            })
+        if self.feed_modes is not None:
+            data['feed_modes'] = self.feed_modes
+        return data
+
+def load_dashboard_feed(user, now):
+    """Hämtar allt översikten behöver i ett fast antal SQL-satser.
+
+    Medlemskap + klass laddas med en JOIN, ämnen och uppgifter med
+    selectin-laddning (en sats per nivå oavsett antal klasser/ämnen).
+    Synlighetsreglerna läggs på som laddningsvillkor, så bara synliga
+    ämnen, uppgifter och aktiviteter hämtas.
+    """
+    memberships = (
+        ClassMember.query
+        .filter_by(user_id=user.id)
+        .options(
+            db.joinedload(ClassMember.class_obj)
+            .selectinload(Class.subjects.and_(subject_followed(Subject.id, user.id)))
+            .selectinload(Subject.assignments.and_(
+                assignment_visible(Assignment.type, Assignment.deadline, now),
+                within_horizon(Assignment.deadline, now),
+            ))
+        )
+        .all()
+    )
+    skills = SubjectSkill.query.filter_by(user_id=user.id).all()
+    activities = Activity.query.filter(
+        Activity.user_id == user.id,
+        activity_visible(Activity.end_time, now),
+        within_horizon(Activity.start_time, now),
+    ).all()
+
+    return {
+        'memberships': memberships,
+        'skills': {s.subject_id: s.skill_factor for s in skills},
+        'activities': activities,
+    }
+
+def rank_feed_in_python(user, feed, now, mode=None):
+    """Bygger och rankar alla synliga objekt i Python (reservväg utan SQL-rankning)."""
+    mode = mode or user.dashboard_mode
+    user_skills_dict = feed['skills']
+
+    combined_items, skill_factors = [], []
+    for membership in feed['memberships']:
+        cls = membership.class_obj
+        if cls is None:
+            continue
+        role = membership.role or 'member'
+        # "Läser ej"-ämnen och utgångna uppgifter är redan bortfiltrerade i load_dashboard_feed()
+        for subj in cls.subjects:
+            skill_factor = user_skills_dict.get(subj.id, DEFAULT_SKILL_FACTOR)
+            for a in subj.assignments:
+                combined_items.append(FeedItem(
+                    'assignment', a.id, a.title, a.deadline, now,
+                    subject_id=subj.id,
+                    subject_name=subj.name,
+                    class_id=cls.id,
+                    class_name=cls.name,
+                    created_by=a.created_by,
+                    assignment_type=a.type,
+                    role=role,
+                    weight=subj.weight_factor,
+                ))
+                skill_factors.append(skill_factor)
+
+    # Aktiviteter
+    for act in feed['activities']:
+        combined_items.append(FeedItem('activity', act.id, act.name, act.start_time, now, end_time=act.end_time))
+        skill_factors.append(1.0)
+
+    # Räkna ut Prioritets-score för alla objekt (som inte filtrerats bort) i ett svep,
+    # för båda lägena så att klienten kan byta läge utan ny request
+    deadlines = [item.due.timestamp() if item.due else math.nan for item in combined_items]
+    weights = [item.weight for item in combined_items]
+    kinds = [ITEM_KIND_ACTIVITY if item.type == 'activity' else ITEM_KIND_ASSIGNMENT for item in combined_items]
+    scores_by_mode = {
+        m: score_batch(deadlines, weights, skill_factors, kinds, m, now) for m in DASHBOARD_MODES
+    }
+    for index, item in enumerate(combined_items):
+        item.scores = {m: float(scores[index]) for m, scores in scores_by_mode.items()}
+        item.priority_score = item.scores[mode]
+
+    # Sortera efter Score (Högst först), sedan samma nyckel som keyset-pagineringen
+    combined_items.sort(key=feed_sort_key)
+    return combined_items
+
+def days_until_sql(column, now):
+    """SQL-uttryck för antal (bråk)dagar från `now` till `column`."""
+    if db.engine.dialect.name == 'sqlite':
+        return func.julianday(column) - func.julianday(now)
+    return func.extract('epoch', column - now) / 86400.0
+
+def priority_score_sql(mode, kind, due, weight, skill_factor, now):
+    """Samma modeller som calculate_priority_score(), uttryckta i SQL."""
+    raw_t = days_until_sql(due, now)
+    t = case((raw_t < 0, 0.0), else_=raw_t)
+
+    if mode == 'planerare':
+        # Modell 2: Score = (W*S) / (sqrt(T) + 1)
+        assignment_score = (weight * skill_factor) / (func.sqrt(t) + 1)
+    else:
+        # Modell 1: Score = (W*S) / (T + 1)^1.5
+        assignment_score = (weight * skill_factor) / func.power(t + 1, 1.5)
+
+    return func.coalesce(
+        case((kind == 'activity', 1.8 / (t + 1)), else_=assignment_score),
+        0.0
+    )
+
+USER_FEED_COLUMNS = (
+    'user_id', 'kind', 'item_id', 'title', 'due', 'end_time', 'subject_id', 'subject_name',
+    'class_id', 'class_name', 'created_by', 'assignment_type', 'role', 'weight', 'skill_factor',
+)
+
+def user_feed_source(user_id=None, class_id=None, subject_id=None, assignment_id=None, activity_id=None):
+    """SELECT:er som tar fram user_feed-rader direkt från grundtabellerna.
+
+    Utan argument täcks alla användare (ombyggnad); med argument bara de
+    rader som berörs av en ändring. "Läser ej"-ämnen tas bort redan här,
+    medan deadline-filtreringen sker vid läsning eftersom den beror på tiden.
+    """
+    skill_factor = func.coalesce(SubjectSkill.skill_factor, DEFAULT_SKILL_FACTOR)
+    selects = []
+
+    def labelled(*columns):
+        return db.select(*[column.label(name) for column, name in zip(columns, USER_FEED_COLUMNS)])
+
+    if activity_id is None:
+        assignments = (
+            labelled(
+                ClassMember.user_id,
+                literal('assignment'),
+                Assignment.id,
+                Assignment.title,
+                Assignment.deadline,
+                db.cast(null(), db.DateTime),
+                Subject.id,
+                Subject.name,
+                Class.id,
+                Class.name,
+                Assignment.created_by,
+                Assignment.type,
+                ClassMember.role,
+                Subject.weight_factor,
+                skill_factor,
+            )
+            .select_from(ClassMember)
+            .join(Class, Class.id == ClassMember.class_id)
+            .join(Subject, Subject.class_id == Class.id)
+            .join(Assignment, Assignment.subject_id == Subject.id)
+            .outerjoin(SubjectSkill, and_(
+                SubjectSkill.subject_id == Subject.id,
+                SubjectSkill.user_id == ClassMember.user_id,
+            ))
+            .where(skill_followed(SubjectSkill.level))
+        )
+        if user_id is not None:
+            assignments = assignments.where(ClassMember.user_id == user_id)
+        if class_id is not None:
+            assignments = assignments.where(Class.id == class_id)
+        if subject_id is not None:
+            assignments = assignments.where(Subject.id == subject_id)
+        if assignment_id is not None:
+            assignments = assignments.where(Assignment.id == assignment_id)
+        selects.append(assignments)
+
+    if class_id is None and subject_id is None and assignment_id is None:
+        activities = labelled(
+            Activity.user_id,
+            literal('activity'),
+            Activity.id,
+            Activity.name,
+            Activity.start_time,
+            Activity.end_time,
+            db.cast(null(), db.Integer),
+            db.cast(null(), db.String),
+            db.cast(null(), db.Integer),
+            db.cast(null(), db.String),
+            db.cast(null(), db.Integer),
+            db.cast(null(), db.String),
+            literal('owner'),
+            literal(1.0),
+            literal(1.0),
+        )
+        if user_id is not None:
+            activities = activities.where(Activity.user_id == user_id)
+        if activity_id is not None:
+            activities = activities.where(Activity.id == activity_id)
+        selects.append(activities)
+
+    return selects
+
+def sync_user_feed(user_id=None, class_id=None, subject_id=None, assignment_id=None, activity_id=None):
+    """Räknar om user_feed-raderna som berörs av en ändring (anroparen committar)."""
+    db.session.flush()
+
+    stale = db.delete(UserFeedItem)
+    if user_id is not None:
+        stale = stale.where(UserFeedItem.user_id == user_id)
+    if class_id is not None:
+        stale = stale.where(UserFeedItem.class_id == class_id)
+    if subject_id is not None:
+        stale = stale.where(UserFeedItem.subject_id == subject_id)
+    if assignment_id is not None:
+        stale = stale.where(UserFeedItem.kind == 'assignment', UserFeedItem.item_id == assignment_id)
+    if activity_id is not None:
+        stale = stale.where(UserFeedItem.kind == 'activity', UserFeedItem.item_id == activity_id)
+    db.session.execute(stale)
+
+    for stmt in user_feed_source(user_id, class_id, subject_id, assignment_id, activity_id):
+        db.session.execute(db.insert(UserFeedItem).from_select(USER_FEED_COLUMNS, stmt))
+
+    # Ändringar för en användare syns bara för den, klassändringar för alla medlemmar
+    if user_id is not None:
+        bump_data_versions(user_version_key(user_id))
+    elif class_id is not None:
+        bump_data_versions(class_version_key(class_id))
+
+def rebuild_user_feed():
+    """Bygger om hela user_feed i bulk. Returnerar antal rader."""
+    db.session.execute(db.delete(UserFeedItem))
+    for stmt in user_feed_source():
+        db.session.execute(db.insert(UserFeedItem).from_select(USER_FEED_COLUMNS, stmt))
+    db.session.commit()
+    return db.session.scalar(db.select(func.count()).select_from(UserFeedItem))
+
+def check_user_feed():
+    """Jämför user_feed med grundtabellerna. Returnerar (saknade, överflödiga) rader."""
+    expected = set()
+    for stmt in user_feed_source():
+        expected.update(tuple(row) for row in db.session.execute(stmt))
+    columns = [getattr(UserFeedItem, name) for name in USER_FEED_COLUMNS]
+    actual = {tuple(row) for row in db.session.execute(db.select(*columns))}
+    return expected - actual, actual - expected
+
+def user_version_key(user_id):
+    return f'user:{user_id}'
+
+def class_version_key(class_id):
+    return f'class:{class_id}'
+
+def bump_data_versions(*keys):
+    """Räknar upp versionerna för nycklarna (anroparen committar)."""
+    dialect_insert = postgresql.insert if db.engine.dialect.name == 'postgresql' else sqlite.insert
+    for key in keys:
+        stmt = dialect_insert(DataVersion).values(key=key, version=1)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[DataVersion.key],
+            set_={'version': DataVersion.version + 1},
+        )
+        db.session.execute(stmt)
+
+def data_version_token(user_id, class_id=None, subject_id=None):
+    """Versionstoken för det en sida visar, hämtat med en enda liten SELECT.
+
+    Alltid användarens egen version, plus klassens version (klass-/ämnessida)
+    eller versionen för varje klass användaren är medlem i (översikten).
+    """
+    if class_id is not None:
+        class_keys = [class_version_key(class_id)]
+    elif subject_id is not None:
+        class_keys = (
+            db.select(literal('class:').concat(db.cast(Subject.class_id, db.String)))
+            .where(Subject.id == subject_id)
+        )
+    else:
+        class_keys = (
+            db.select(literal('class:').concat(db.cast(ClassMember.class_id, db.String)))
+            .where(ClassMember.user_id == user_id)
+        )
+
+    rows = db.session.execute(
+        db.select(DataVersion.key, DataVersion.version)
+        .where(or_(DataVersion.key == user_version_key(user_id), DataVersion.key.in_(class_keys)))
+    )
+    return tuple(sorted(rows))
+
+class DashboardCache:
+    """Processlokal LRU-cache för färdigräknade översikter.
+
+    En post gäller bara så länge versionstoken är oförändrad och TTL:en
+    inte har gått ut.
+    """
+
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key, token):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != token or entry[1] < datetime.now():
+                METRICS['dashboard_cache_misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            METRICS['dashboard_cache_hits'] += 1
+            return entry[2]
+
+    def peek(self, key):
+        """(token, översikt, uträknad) för senaste posten oavsett token och TTL, annars None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            return entry[0], entry[2], entry[1] - timedelta(seconds=self.ttl)
+
+    def contains(self, key, token):
+        """Finns en giltig post? Räknas inte som träff/miss och ändrar inte LRU-ordningen."""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and entry[0] == token and entry[1] >= datetime.now()
+
+    def set(self, key, token, value):
+        with self._lock:
+            self._entries[key] = (token, datetime.now() + timedelta(seconds=self.ttl), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+METRICS = Counter()
+dashboard_cache = DashboardCache(app.config['DASHBOARD_CACHE_TTL'], app.config['DASHBOARD_CACHE_SIZE'])
+
+def cached_dashboard(user, now=None, token=None):
+    """build_dashboard() via cachen — en träff kostar bara versionsfrågan."""
+    token = token if token is not None else data_version_token(user.id)
+    # Modellen innehåller alla lägen, så ett lägesbyte kan återanvända posten
+    key = user.id
+    dashboard = dashboard_cache.get(key, token)
+    if dashboard is None:
+        dashboard = build_dashboard(user, now)
+        dashboard_cache.set(key, token, dashboard)
+    return dashboard
+
+_page_templates = {}
+
+def page_template(source):
+    """Kompilerad mall för en mallsträng (render_template_string kompilerar om varje gång)."""
+    template = _page_templates.get(source)
+    if template is None:
+        template = _page_templates[source] = app.jinja_env.from_string(source)
+    return template
+
+def _buffered(chunks, size):
+    """Slår ihop Jinjas små utdatabitar till bitar om minst `size` tecken."""
+    buffer, length = [], 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            yield ''.join(buffer)
+            buffer, length = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+def render_page(source, **context):
+    """Som render_template_string(), men strömmar sidan när STREAM_TEMPLATES är på.
+
+    Head, stilar och layout skickas medan resten av mallen renderas; värden
+    som mallen hämtar via anrop (t.ex. load_dashboard()) räknas ut först
+    när mallen når dem.
+    """
+    template = page_template(source)
+    if not app.config['STREAM_TEMPLATES']:
+        return render_template(template, **context)
+
+    # Sessionen sparas innan en strömmad body skickas, så flash-meddelanden
+    # plockas ur den nu (mallens get_flashed_messages() läser samma lista)
+    if '_flashes' in session:
+        get_flashed_messages(with_categories=True)
+    # Sessionssparandet committar innan mallen körs; låt inte det tömma redan laddade objekt
+    db.session().expire_on_commit = False
+    chunks = _buffered(stream_template(template, **context), app.config['STREAM_CHUNK_SIZE'])
+    return Response(chunks, mimetype='text/html')
+
+_precomputes = {}  # user_id -> Event som sätts när beräkningen är klar
+_precompute_lock = Lock()
+
+def precompute_dashboard(user_id, metric='dashboard_precomputed'):
+    """Räknar ut användarens översikt till cachen i en bakgrundstråd.
+
+    Samtidiga anrop för samma användare slås ihop till en beräkning.
+    Returnerar beräkningens Event, som sätts när den är klar.
+    """
+    with _precompute_lock:
+        done = _precomputes.get(user_id)
+        if done is not None:
+            METRICS['dashboard_precompute_coalesced'] += 1
+            return done
+        done = _precomputes[user_id] = Event()
+    Thread(target=_precompute_dashboard, args=(user_id, done, metric), daemon=True).start()
+    return done
+
+def _precompute_dashboard(user_id, done, metric):
+    try:
+        with app.app_context():
+            user = db.session.get(User, user_id)
+            if user is not None:
+                cached_dashboard(user)
+                METRICS[metric] += 1
+    except Exception as e:
+        print(f"Fel vid förberäkning av översikt: {e}")
+    finally:
+        with _precompute_lock:
+            _precomputes.pop(user_id, None)
+        done.set()
+
+def wait_for_precompute(user_id, timeout):
+    """Väntar på en pågående förberäkning i stället för att räkna ut samma sak igen."""
+    with _precompute_lock:
+        done = _precomputes.get(user_id)
+    if done is not None:
+        done.wait(timeout)
+
+def stale_dashboard(user, token):
+    """Senast uträknade översikt om en färsk inte hinner bli klar inom DASHBOARD_FRESH_DEADLINE.
+
+    Omräkningen körs i bakgrunden (en åt gången per användare) och fyller
+    cachen när den blir klar. Returnerar None när en färsk översikt finns i
+    cachen, när ingen tillräckligt ny gammal finns eller när funktionen är av.
+    """
+    if not app.config['DASHBOARD_STALE_WHILE_REVALIDATE'] or dashboard_cache.contains(user.id, token):
+        return None
+    entry = dashboard_cache.peek(user.id)
+    if entry is None or entry[2] < datetime.now() - timedelta(seconds=app.config['DASHBOARD_STALE_MAX_AGE']):
+        return None
+
+    # Pågår redan en omräkning väntar vi inte en gång till, så att anropen inte köar på den
+    with _precompute_lock:
+        in_flight = user.id in _precomputes
+    done = precompute_dashboard(user.id, 'dashboard_revalidated')
+    if not in_flight and done.wait(app.config['DASHBOARD_FRESH_DEADLINE']) \
+            and dashboard_cache.contains(user.id, token):
+        return None
+    METRICS['dashboard_served_stale'] += 1
+    return entry[1]
+
+def page_etag(user, token, *parts):
+    """Stark validator för en sida: användare, datatoken, tidshink och övriga indata."""
+    bucket = int(time.time() // app.config['DASHBOARD_CACHE_TTL'])
+    raw = repr((user.id, token, bucket) + parts)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+def not_modified(etag):
+    """Ett 304-svar om klienten redan har sidan, annars None.
+
+    Väntande flash-meddelanden måste renderas, så då svarar vi aldrig 304.
+    """
+    if '_flashes' in session or etag not in request.if_none_match:
+        return None
+    response = make_response('', 304)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def with_etag(html, etag):
+    response = make_response(html)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def visible_feed_filter(now):
+    """Synlighetsreglerna tillämpade på user_feed ("Läser ej" är redan borttaget vid skrivning)."""
+    return and_(
+        or_(
+            and_(UserFeedItem.kind == 'assignment',
+                 assignment_visible(UserFeedItem.assignment_type, UserFeedItem.due, now)),
+            and_(UserFeedItem.kind == 'activity', activity_visible(UserFeedItem.end_time, now)),
+        ),
+        within_horizon(UserFeedItem.due, now),
+    )
+
+def feed_item_from_row(row, now):
+    """Gör om en user_feed-rad (med poängkolumner) till ett FeedItem."""
+    return FeedItem(
+        row.kind, row.item_id, row.title, row.due, now,
+        end_time=row.end_time,
+        subject_id=row.subject_id,
+        subject_name=row.subject_name,
+        class_id=row.class_id,
+        class_name=row.class_name,
+        created_by=row.created_by,
+        assignment_type=row.assignment_type,
+        role=row.role,
+        weight=row.weight,
+        priority_score=row.priority_score,
+        scores=feed_row_scores(row),
+    )
+
+def feed_row_scores(row):
+    """{läge: poäng} för alla lägen som rank_dashboard_items() valt ut."""
+    return {mode: row._mapping[f'score_{mode}'] for mode in DASHBOARD_MODES}
+
+def feed_sort_key(item):
+    """Flödets totala ordning: högst poäng först, sedan typ och id."""
+    return (-item.priority_score, item.type, item.id)
+
+def feed_mode_scores(now):
+    """{läge: SQL-poänguttryck} över user_feed för alla översiktslägen."""
+    return {
+        mode: priority_score_sql(
+            mode, UserFeedItem.kind, UserFeedItem.due, UserFeedItem.weight, UserFeedItem.skill_factor, now
+        )
+        for mode in DASHBOARD_MODES
+    }
+
+def rank_dashboard_items(user_id, mode, now, limit=None, after=None):
+    """Rankar användarens user_feed-rader i databasen och returnerar bara de `limit` bästa.
+
+    `after` = (poäng, typ, id) för sista objektet på föregående sida
+    (keyset-paginering; kostar lika mycket oavsett hur djupt man scrollat).
+    """
+    limit = limit or app.config['DASHBOARD_PAGE_SIZE']
+    mode_scores = feed_mode_scores(now)
+    score = mode_scores[mode]
+
+    query = (
+        db.select(
+            UserFeedItem.__table__,
+            score.label('priority_score'),
+            *[s.label(f'score_{m}') for m, s in mode_scores.items()],
+        )
+        .where(
+            UserFeedItem.user_id == user_id,
+            visible_feed_filter(now),
+        )
+        .order_by(score.desc(), UserFeedItem.kind, UserFeedItem.item_id)
+        .limit(limit)
+    )
+    if after is not None:
+        after_score, after_kind, after_id = after
+        query = query.where(or_(
+            score < after_score,
+            and_(score == after_score, db.tuple_(UserFeedItem.kind, UserFeedItem.item_id) > (after_kind, after_id)),
+        ))
+    return [feed_item_from_row(row, now) for row in db.session.execute(query)]
+
+def feed_item_ranks(user_id, mode, kind, item_id, now):
+    """Ett objekt ur användarens flöde plus dess plats (1-baserad) i varje läge.
+
+    Returnerar (objekt, {läge: plats}) eller None om objektet inte syns.
+    Platserna räknas med fönsterfunktioner i en enda sats.
+    """
+    mode_scores = feed_mode_scores(now)
+    ranked = (
+        db.select(
+            UserFeedItem.__table__,
+            mode_scores[mode].label('priority_score'),
+            *[score.label(f'score_{m}') for m, score in mode_scores.items()],
+            *[
+                func.row_number().over(order_by=(score.desc(), UserFeedItem.kind, UserFeedItem.item_id))
+                .label(f'rank_{m}')
+                for m, score in mode_scores.items()
+            ],
+        )
+        .where(
+            UserFeedItem.user_id == user_id,
+            visible_feed_filter(now),
+        )
+        .subquery()
+    )
+    row = db.session.execute(
+        db.select(ranked).where(ranked.c.kind == kind, ranked.c.item_id == item_id)
+    ).first()
+    if row is None:
+        return None
+    return feed_item_from_row(row, now), {m: row._mapping[f'rank_{m}'] for m in DASHBOARD_MODES}
+
+def encode_feed_cursor(mode, now, item):
+    """Opak, signerad markör: läge, referenstid och sista objektets sorteringsnyckel."""
+    return serializer.dumps(
+        [mode, now.isoformat(), item.priority_score, item.type, item.id],
+        salt='feed-cursor'
+    )
+
+def decode_feed_cursor(cursor):
+    """Returnerar (läge, referenstid, (poäng, typ, id)) eller None om markören är ogiltig."""
+    try:
+        mode, ref_time, score, kind, item_id = serializer.loads(cursor, salt='feed-cursor')
+        return mode, datetime.fromisoformat(ref_time), (float(score), kind, int(item_id))
+    except Exception:
+        return None
+
+def dashboard_feed_page(user, mode, now, after=None):
+    """En sida av flödet plus markören till nästa (None när flödet är slut)."""
+    page_size = app.config['DASHBOARD_PAGE_SIZE']
+
+    if app.config['DASHBOARD_SQL_RANKING']:
+        items = rank_dashboard_items(user.id, mode, now, after=after)
+    else:
+        items = rank_feed_in_python(user, load_dashboard_feed(user, now), now, mode)
+        if after is not None:
+            after_key = (-after[0], after[1], after[2])
+            items = [item for item in items if feed_sort_key(item) > after_key]
+        items = items[:page_size]
+
+    next_cursor = encode_feed_cursor(mode, now, items[-1]) if len(items) == page_size else None
+    return items, next_cursor
+
+def feed_item_json(item):
+    """JSON-form av ett flödesobjekt, med åtgärds-URL:er."""
+    data = item.to_dict()
+    if item.type == 'activity':
+        data['edit_url'] = url_for('edit_activity', activity_id=item.id)
+        data['delete_url'] = url_for('delete_activity', activity_id=item.id)
+    elif item.role == 'admin':
+        data['edit_url'] = url_for('edit_assignment', assignment_id=item.id)
+        data['delete_url'] = url_for('delete_assignment', assignment_id=item.id)
+    return data
+
+def build_dashboard(user, now=None):
+    """Bygger hela översiktsmodellen (klasser och första sidan av flödet i varje läge).
+
+    Modellen är oberoende av användarens valda läge: varje objekt bär sina
+    poäng för alla lägen och vilka lägens första sida det hör till
+    (`feed_modes`), så att klienten kan byta läge utan ny request.
+    """
+    now = now or datetime.now()
+
+    memberships = (
+        ClassMember.query
+        .filter_by(user_id=user.id)
+        .options(db.joinedload(ClassMember.class_obj))
+        .all()
+    )
+
+    merged, next_cursors = {}, {}
+    for mode in DASHBOARD_MODES:
+        page, next_cursors[mode] = dashboard_feed_page(user, mode, now)
+        for item in page:
+            item = merged.setdefault(item.key, item)
+            if item.feed_modes is None:
+                item.feed_modes = []
+            item.feed_modes.append(mode)
+
+    # Förbered klasser med roller
+    # Vanliga dicts i stället för ORM-objekt så att modellen kan cachas mellan requests
+    classes_with_role = [
+        {
+            'class': {'id': m.class_obj.id, 'name': m.class_obj.name, 'join_code': m.class_obj.join_code},
+            'role': m.role or 'member',
+        }
+        for m in memberships if m.class_obj is not None
+    ]
+
+    return {
+        'classes': classes_with_role,
+        'items': list(merged.values()),
+        'is_any_admin': any(c['role'] == 'admin' for c in classes_with_role),
+        'next_cursors': next_cursors,
+    }
+
+def dashboard_items_for_mode(dashboard, mode):
+    """Översiktens objekt i ordning för `mode`; övriga lägens objekt sist (dolda i mallen)."""
+    items = sorted(
+        dashboard['items'],
+        key=lambda item: (mode not in item.feed_modes, -item.scores[mode], item.type, item.id)
+    )
+
+    # Hämta den absoluta topp-uppgiften för countdown (om den har en deadline)
+    top_assignment = None
+    if items and mode in items[0].feed_modes and items[0].type == 'assignment':
+        first_item = items[0]
+        if first_item.deadline:
+            top_assignment = first_item
+    return items, top_assignment
+
+# ---------- Live-uppdateringar (SSE) ----------
+FEED_CHANNEL = 'feed_changes'
+
+def record_feed_change(class_id, kind, item_id, op):
+    """Loggar en ändring för live-strömmarna (anroparen committar).
+
+    På Postgres skickas även en NOTIFY, som levereras först vid commit.
+    Utan live-flöde finns ingen läsare, så då loggas ingenting.
+    """
+    if not app.config['LIVE_FEED_ENABLED']:
+        return
+    db.session.add(FeedChange(class_id=class_id, kind=kind, item_id=item_id, op=op))
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute(db.select(func.pg_notify(FEED_CHANNEL, str(class_id))))
+
+class FeedChangeHub:
+    """Delar ut nya rader i feed_changes till processens öppna SSE-strömmar.
+
+    En enda bakgrundstråd per worker läser tabellen: LISTEN/NOTIFY på
+    Postgres, pollning annars. Strömmarna väntar bara på sin kö och rör
+    inte databasen förrän något hänt i någon av deras klasser.
+    """
+
+    def __init__(self):
+        self._subscribers = {}  # class_id -> set av köer
+        self._lock = Lock()
+        self._thread = None
+
+    def subscribe(self, class_ids):
+        changes = queue.Queue()
+        with self._lock:
+            for class_id in class_ids:
+                self._subscribers.setdefault(class_id, set()).add(changes)
+            if self._thread is None:
+                self._thread = Thread(target=self._run, name='feed-change-hub', daemon=True)
+                self._thread.start()
+        return changes
+
+    def unsubscribe(self, changes, class_ids):
+        with self._lock:
+            for class_id in class_ids:
+                subscribers = self._subscribers.get(class_id)
+                if subscribers is not None:
+                    subscribers.discard(changes)
+                    if not subscribers:
+                        del self._subscribers[class_id]
+
+    def publish(self, change):
+        with self._lock:
+            subscribers = list(self._subscribers.get(change['class_id'], ()))
+        for changes in subscribers:
+            changes.put(change)
+
+    def _listen(self):
+        """Öppnar en egen LISTEN-anslutning och returnerar en väntefunktion."""
+        connection = db.engine.raw_connection()
+        dbapi_connection = connection.driver_connection
+        dbapi_connection.autocommit = True
+        with dbapi_connection.cursor() as cursor:
+            cursor.execute(f'LISTEN {FEED_CHANNEL}')
+
+        def wait():
+            # Timeouten ger en pollning ändå, som skyddsnät om en NOTIFY missas
+            if select.select([dbapi_connection], [], [], app.config['FEED_STREAM_HEARTBEAT'])[0]:
+                dbapi_connection.poll()
+                dbapi_connection.notifies.clear()
+
+        return connection, wait
+
+    def _run(self):
+        with app.app_context():
+            last_id = db.session.scalar(db.select(func.max(FeedChange.id))) or 0
+            db.session.remove()
+            listener, wait = None, None
+
+            while True:
+                try:
+                    if db.engine.dialect.name == 'postgresql':
+                        if wait is None:
+                            listener, wait = self._listen()
+                        wait()
+                    else:
+                        time.sleep(app.config['FEED_POLL_INTERVAL'])
+
+                    rows = db.session.execute(
+                        db.select(FeedChange).where(FeedChange.id > last_id).order_by(FeedChange.id)
+                    ).scalars().all()
+                    for row in rows:
+                        last_id = row.id
+                        self.publish({'id': row.id, 'class_id': row.class_id, 'kind': row.kind,
+                                      'item_id': row.item_id, 'op': row.op})
+                except Exception as e:
+                    print(f"Fel i live-flödet: {e}")
+                    db.session.rollback()
+                    if listener is not None:
+                        listener.invalidate()
+                    listener, wait = None, None
+                    time.sleep(app.config['FEED_POLL_INTERVAL'])
+                finally:
+                    db.session.remove()
+
+feed_change_hub = FeedChangeHub()
+
+def feed_change_event(user_id, mode, change, now=None):
+    """Gör om en ändring till ett SSE-meddelande med användarens delta."""
+    now = now or datetime.now()
+    key = f"{change['kind']}-{change['item_id']}"
+    ranked = None
+    if change['op'] != 'delete':
+        ranked = feed_item_ranks(user_id, mode, change['kind'], change['item_id'], now)
+
+    if ranked is None:
+        # Raderad, eller syns inte längre för just den här användaren
+        delta = {'op': 'delete', 'key': key}
+    else:
+        item, ranks = ranked
+        delta = {'op': 'upsert', 'key': key, 'item': feed_item_json(item), 'ranks': ranks}
+    return f"id: {change['id']}\nevent: feed\ndata: {json.dumps(delta)}\n\n"
+
+def prune_feed_changes():
+    """Tar bort ändringar äldre än retentionstiden (ingen ström behöver dem längre)."""
+    cutoff = datetime.now() - timedelta(minutes=app.config['FEED_CHANGE_RETENTION_MINUTES'])
+    result = db.session.execute(db.delete(FeedChange).where(FeedChange.created_at < cutoff))
+    db.session.commit()
+    return result.rowcount
+
 # ---------- Routes ----------
 @app.route('/profile')
 @login_required
@@ -480,7 +1882,10 @@ def delete_profile():
     # Ta bort klasser där användaren är admin
     for cls in Class.query.filter_by(admin_user_id=user.id).all():
         db.session.delete(cls)
+        sync_user_feed(class_id=cls.id)
     
+    UserFeedItem.query.filter_by(user_id=user.id).delete()
+    ActivityArchive.query.filter_by(user_id=user.id).delete()
     db.session.delete(user)
     db.session.commit()
     logout_user()
@@ -496,125 +1901,198 @@ def index():
 
     user = current_user()
     now = datetime.now()
-    weight_map = {'50p': 1, '100p': 2, '150p': 3, 'Gymnasiearbete': 4, 'Ingen vikt': 1}
-
-    # 1. Hämta användarens färdighetsnivåer tidigt (behövs för både filtrering och scoring)
-    skills = SubjectSkill.query.filter_by(user_id=user.id).all()
-    user_skills_dict = {s.subject_id: s.level for s in skills}
-
-    # Hämta alla medlemskap för denna användare
-    memberships = ClassMember.query.filter_by(user_id=user.id).all()
-    classes = [m.class_obj for m in memberships if m.class_obj is not None]
-
-    # Förbered klasser med roller
-    classes_with_role = []
-    for class_obj in classes:
-        if not class_obj:
-            continue
-        membership = next((m for m in memberships if m.class_id == class_obj.id), None)
-        role = membership.role if membership else 'member'
-        classes_with_role.append({'class': class_obj, 'role': role})
-
-    # Förbered uppgifter och prov
-    combined_items = []
-    for item in classes_with_role:
-        cls = item['class']
-        role = item['role']
-        for subj in cls.subjects:
-            
-            # --- FILTRERING: Om användaren valt "Läser ej", hoppa över hela ämnet ---
-            if user_skills_dict.get(subj.id) == 'Läser ej':
-                continue
-            # -----------------------------------------------------------------------
-
-            for a in subj.assignments:
-                # Hoppa över uppgifter/prov som passerat deadline
-                if a.type == 'Uppgift' and a.deadline and a.deadline < now:
-                    continue
-                if a.type == 'Prov' and a.deadline and a.deadline.date() < now.date():
-                    continue
-
-                # Beräkna färg baserat på deadline
-                if a.deadline:
-                    delta = a.deadline - now
-                    days_left = delta.days + (delta.seconds / 86400)
-                else:
-                    days_left = None
-
-                if days_left is None:
-                    color = "#f8f9fa"
-                elif days_left > 14:
-                    color = "#44ce1b"
-                elif days_left > 7:
-                    color = "#bbdb44"
-                elif days_left > 3:
-                    color = "#fad928"
-                elif days_left > 1:
-                    color = "#f2a134"
-                elif days_left > 0:
-                    color = "#e51f1f"
-                else:  # overdue
-                    color = "#6a6af7"
-
-                combined_items.append({
-                    'id': a.id,
-                    'title': a.title,
-                    'type': 'assignment',
-                    'deadline': a.deadline,
-                    'subject_name': subj.name,
-                    'subject_id': subj.id,
-                    'weight': weight_map.get(subj.weight, 1),
-                    'class_name': cls.name,
-                    'class_id': cls.id,
-                    'created_by': a.created_by,
-                    'color': color,
-                    'role': role,
-                    'assignment_type': a.type
-                })
-
-    # Hämta alla aktiviteter
-    activities = Activity.query.filter_by(user_id=user.id).all()
-    for act in activities:
-        combined_items.append({
-            'id': act.id,
-            'type': 'activity',
-            'title': act.name,
-            'start_time': act.start_time,
-            'end_time': act.end_time,
-            'role': 'owner',  # alltid admin för egna aktiviteter
-            'color': '#7da0ff'
-        })
 
-    # 2. Räkna ut Prioritets-score för varje objekt (som inte filtrerats bort)
-    for item in combined_items:
-        item['priority_score'] = calculate_priority_score(item, user.dashboard_mode, user_skills_dict)
+    token = data_version_token(user.id)
 
-    # 3. Sortera efter Score (Högst först)
-    combined_items.sort(key=lambda x: x['priority_score'], reverse=True)
+    # Första översikten efter inloggning: använd förberäkningen och mät om den hann bli klar
+    if session.pop('dashboard_first_hit', False):
+        wait_for_precompute(user.id, app.config['DASHBOARD_PRECOMPUTE_WAIT'])
+        warm = dashboard_cache.contains(user.id, token)
+        METRICS['dashboard_first_hit_warm' if warm else 'dashboard_first_hit_cold'] += 1
 
-    delete_expired_assignments()  # radera gamla uppgifter
+    etag = page_etag(user, token, 'index', user.name, user.dashboard_mode, user.has_seen_guide)
+    cached_response = not_modified(etag)
+    if cached_response is not None:
+        return cached_response
 
-    today = now.strftime('%Y-%m-%d')
+    # Under hög last: visa senaste översikten hellre än att låta anropet köa på databasen
+    stale = stale_dashboard(user, token)
 
-    is_any_admin = ClassMember.query.filter_by(user_id=user.id, role='admin').first() is not None
-
-    # Hämta den absoluta topp-uppgiften för countdown (om den har en deadline)
-    top_assignment = None
-    if combined_items and combined_items[0].get('type') == 'assignment':
-        first_item = combined_items[0]
-        if first_item.get('deadline'):
-            top_assignment = first_item
+    def load_dashboard():
+        # Anropas av mallen efter navigeringen, så att sidans början redan är skickad
+        dashboard = stale if stale is not None else cached_dashboard(user, now, token)
+        items, top_assignment = dashboard_items_for_mode(dashboard, user.dashboard_mode)
+        return {
+            'classes': dashboard['classes'],
+            'assignments': items,
+            'is_any_admin': dashboard['is_any_admin'],
+            'top_assignment': top_assignment,  # <-- VIKTIGT: Skicka med denna!
+            'next_cursors': dashboard['next_cursors'],
+            'stale': stale is not None,
+        }
 
-    return render_template_string(
+    html = render_page(
         DASH_TEMPLATE,
         user=user,
-        classes=classes_with_role,
-        assignments=combined_items[:50],
-        is_any_admin=is_any_admin,
-        today=today,
-        top_assignment=top_assignment,  # <-- VIKTIGT: Skicka med denna!
+        load_dashboard=load_dashboard,
+        today=now.strftime('%Y-%m-%d'),
+        modes=DASHBOARD_MODES,
         now=now
     )
+    if stale is not None:
+        # Ingen ETag: en gammal översikt får inte bli kvar i webbläsaren som om den vore aktuell
+        response = make_response(html)
+        response.headers['Cache-Control'] = 'private, no-store'
+        return response
+    return with_etag(html, etag)
+
+@app.route('/dashboard/feed')
+@login_required
+def dashboard_feed():
+    """Nästa sida av översiktens flöde ("ladda fler") som JSON."""
+    decoded = decode_feed_cursor(request.args.get('cursor', ''))
+    if decoded is None:
+        return jsonify({'error': 'Ogiltig markör.'}), 400
+
+    mode, ref_time, after = decoded
+    items, next_cursor = dashboard_feed_page(current_user(), mode, ref_time, after)
+    return jsonify({
+        'items': [feed_item_json(item) for item in items],
+        'next_cursor': next_cursor,
+    })
+
+# ---------- API (iOS-appen) ----------
+API_FEED_FIELDS = (
+    'id', 'type', 'title', 'role', 'color', 'priority_score', 'scores', 'deadline', 'start_time',
+    'end_time', 'subject_name', 'subject_id', 'weight', 'class_name', 'class_id', 'created_by',
+    'assignment_type',
+)
+
+def api_error(message, status):
+    return jsonify({'error': message}), status
+
+def api_json_response(data, etag):
+    """Kompakt JSON med ETag, gzip:ad om klienten klarar det och svaret är stort nog."""
+    body = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    response = make_response(body)
+    response.mimetype = 'application/json'
+    if 'gzip' in request.accept_encodings and len(body) >= app.config['API_GZIP_MIN_SIZE']:
+        response.set_data(gzip.compress(body, compresslevel=6))
+        response.headers['Content-Encoding'] = 'gzip'
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.headers['Vary'] = 'Accept-Encoding, Cookie'
+    return response
+
+@app.route('/api/v1/feed')
+def api_feed():
+    """Översiktens flöde som JSON för appen: rankade objekt, klasser med roll och nedräkning.
+
+    ?mode=sista_minuten|planerare (standard: användarens val),
+    ?fields=title,deadline,... begränsar objektens fält (id och type kommer alltid med).
+    Nästa sida hämtas med /dashboard/feed?cursor=<next_cursor>.
+    """
+    user = current_user()
+    if not user:
+        return api_error("Inte inloggad.", 401)
+
+    mode = request.args.get('mode', user.dashboard_mode)
+    if mode not in DASHBOARD_MODES:
+        return api_error("Okänt läge.", 400)
+
+    fields = None
+    if request.args.get('fields'):
+        fields = {'id', 'type'} | set(request.args['fields'].split(','))
+        unknown = fields - set(API_FEED_FIELDS)
+        if unknown:
+            return api_error(f"Okända fält: {', '.join(sorted(unknown))}", 400)
+
+    # ETag:en skiljer på gzip/okomprimerat eftersom det är olika representationer
+    token = data_version_token(user.id)
+    etag = page_etag(user, token, 'api-feed', mode, sorted(fields or ()), 'gzip' in request.accept_encodings)
+    cached_response = not_modified(etag)
+    if cached_response is not None:
+        return cached_response
+
+    dashboard = cached_dashboard(user, token=token)
+    items, top_assignment = dashboard_items_for_mode(dashboard, mode)
+
+    item_data = []
+    for item in items:
+        if mode not in item.feed_modes:
+            break  # övriga lägens objekt ligger sist
+        data = item.to_dict()
+        data.pop('feed_modes', None)
+        if fields is not None:
+            data = {key: value for key, value in data.items() if key in fields}
+        item_data.append(data)
+
+    return api_json_response({
+        'mode': mode,
+        'items': item_data,
+        'next_cursor': dashboard['next_cursors'][mode],
+        'classes': [
+            {**c['class'], 'role': c['role']} for c in dashboard['classes']
+        ],
+        'countdown': {
+            'id': top_assignment.id,
+            'title': top_assignment.title,
+            'deadline': top_assignment.deadline.isoformat(),
+        } if top_assignment else None,
+    }, etag)
+
+@app.route('/dashboard/stream')
+@login_required
+def dashboard_stream():
+    """SSE-ström med deltan för översikten när uppgifter i användarens klasser ändras."""
+    if not app.config['LIVE_FEED_ENABLED']:
+        abort(404)
+    user = current_user()
+    user_id, mode = user.id, user.dashboard_mode
+    class_ids = db.session.scalars(
+        db.select(ClassMember.class_id).where(ClassMember.user_id == user_id)
+    ).all()
+    last_event_id = request.headers.get('Last-Event-ID', type=int)
+    # Håll ingen databasanslutning medan strömmen är tyst
+    db.session.remove()
+
+    changes = feed_change_hub.subscribe(class_ids)
+
+    def stream():
+        last_sent = last_event_id or 0
+        try:
+            yield "retry: 5000\n\n"
+
+            # Återanslutning: skicka det som hänt sedan senaste mottagna händelse
+            if last_event_id and class_ids:
+                missed = db.session.execute(
+                    db.select(FeedChange)
+                    .where(FeedChange.id > last_event_id, FeedChange.class_id.in_(class_ids))
+                    .order_by(FeedChange.id)
+                ).scalars().all()
+                for row in missed:
+                    change = {'id': row.id, 'class_id': row.class_id, 'kind': row.kind,
+                              'item_id': row.item_id, 'op': row.op}
+                    yield feed_change_event(user_id, mode, change)
+                    last_sent = row.id
+                db.session.remove()
+
+            while True:
+                try:
+                    change = changes.get(timeout=app.config['FEED_STREAM_HEARTBEAT'])
+                except queue.Empty:
+                    yield ": ping\n\n"
+                    continue
+                if change['id'] <= last_sent:
+                    continue
+                yield feed_change_event(user_id, mode, change)
+                last_sent = change['id']
+                db.session.remove()
+        finally:
+            feed_change_hub.unsubscribe(changes, class_ids)
+
+    return Response(stream_with_context(stream()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @app.route('/register', methods=['GET','POST'])
 def register():
@@ -655,15 +2133,15 @@ def register():
             token = serializer.dumps(user.email, salt='email-confirm')
             user.confirmation_token = token
 
-            # Lägg till och commit
+            # Bekräftelsemailet köas i samma commit som användaren och skickas av notify_worker.py
             db.session.add(user)
-            db.session.commit()
-
-            # Skicka bekräftelsemail
             confirm_url = url_for('confirm_email', token=token, _external=True)
-            msg = Message("Bekräfta din e-post", recipients=[user.email])
-            msg.body = f"Hej {user.name},\n\nKlicka på länken för att bekräfta ditt konto:\n{confirm_url}\n\nOm du inte registrerat dig kan du ignorera detta mail."
-            mail.send(msg)
+            enqueue_email(
+                user.email,
+                "Bekräfta din e-post",
+                f"Hej {user.name},\n\nKlicka på länken för att bekräfta ditt konto:\n{confirm_url}\n\nOm du inte registrerat dig kan du ignorera detta mail."
+            )
+            db.session.commit()
 
             flash("Registrering lyckades! Kontrollera din e-post för att bekräfta ditt konto.", "success")
             return redirect(url_for('login'))
@@ -689,6 +2167,10 @@ def login():
             flash("Du måste bekräfta din e-post innan du kan logga in. Kontrollera din inbox.")
             return redirect(url_for('login'))
         login_user(user)
+        if app.config['DASHBOARD_PRECOMPUTE_ON_LOGIN']:
+            # Värm cachen medan webbläsaren följer omdirigeringen till översikten
+            precompute_dashboard(user.id)
+            session['dashboard_first_hit'] = True
         flash("Inloggad.")
         return redirect(url_for('index'))
     return render_template_string(LOGIN_TEMPLATE)
@@ -738,6 +2220,7 @@ def create_class():
         if not UserClass.query.filter_by(user_id=user.id, class_id=new_class.id).first():
             membership = ClassMember(user_id=user.id, class_id=new_class.id, role='admin')
             db.session.add(membership)
+            bump_data_versions(user_version_key(user.id))
             db.session.commit()
 
         flash(f"Klass skapad! Join-kod: {join_code}")
@@ -759,6 +2242,7 @@ def join_class():
         # Lägg till medlem med role='member', om de inte redan finns
         if not ClassMember.query.filter_by(user_id=user.id, class_id=cls.id).first():
             db.session.add(ClassMember(user_id=user.id, class_id=cls.id, role='member'))
+            sync_user_feed(user_id=user.id, class_id=cls.id)
             db.session.commit()
 
         flash(f"Gick med i {cls.name}")
@@ -770,6 +2254,12 @@ def join_class():
 @login_required
 def view_class(class_id):
     user = current_user()
+
+    etag = page_etag(user, data_version_token(user.id, class_id=class_id), 'class', class_id)
+    cached_response = not_modified(etag)
+    if cached_response is not None:
+        return cached_response
+
     cls = Class.query.get_or_404(class_id)
 
     # Kontrollera medlemskap
@@ -789,13 +2279,13 @@ def view_class(class_id):
     user_skills = {s.subject_id: s.level for s in skills}
     # ----------------------------------------
 
-    return render_template_string(
+    return with_etag(render_page(
         CLASS_TEMPLATE, 
         class_data=cls, 
         subjects=subjects, 
         is_admin=is_admin, 
         user_skills=user_skills
-    )
+    ), etag)
 
 # ---------- Subject routes ----------
 @app.route('/class/<int:class_id>/add_subject', methods=['POST'])
@@ -816,6 +2306,7 @@ def add_subject(class_id):
 
     subj = Subject(class_id=cls.id, name=name)
     db.session.add(subj)
+    bump_data_versions(class_version_key(cls.id))
     db.session.commit()
 
     flash(f"Ämne '{name}' har lagts till.")
@@ -837,6 +2328,8 @@ def update_subject_weight(subject_id):
     new_weight = request.form.get('weight')
     if new_weight:
         subj.weight = new_weight
+        subj.weight_factor = weight_factor_for(new_weight)
+        sync_user_feed(class_id=cls.id, subject_id=subj.id)
         db.session.commit()
         flash(f"Vikten för {subj.name} har uppdaterats.")
     
@@ -874,8 +2367,12 @@ def add_assignment(subject_id):
             flash("Fel datumformat.")
             return redirect(url_for('view_subject', subject_id=subject_id))
 
-    assign = Assignment(subject_id=subject_id, title=title, type=type_, deadline=deadline, created_by=user.id)
+    assign = Assignment(subject_id=subject_id, title=title, type=type_, deadline=deadline, created_by=user.id,
+                        next_notify_at=next_notify_at(deadline, datetime.now()))
     db.session.add(assign)
+    db.session.flush()
+    sync_user_feed(class_id=cls.id, assignment_id=assign.id)
+    record_feed_change(cls.id, 'assignment', assign.id, 'upsert')
     db.session.commit()
     flash("Uppgift/prov lagt till.")
     return redirect(url_for('view_subject', subject_id=subject_id))
@@ -893,6 +2390,8 @@ def delete_assignment(assignment_id):
         return redirect(url_for('view_class', class_id=cls.id))
 
     db.session.delete(assign)
+    sync_user_feed(class_id=cls.id, assignment_id=assignment_id)
+    record_feed_change(cls.id, 'assignment', assignment_id, 'delete')
     db.session.commit()
     flash("Uppgift raderad.")
     return redirect(url_for('index', class_id=cls.id))
@@ -914,6 +2413,7 @@ def edit_class(class_id):
             flash("Skriv ett klassnamn.")
             return redirect(url_for('edit_class', class_id=class_id))
         cls.name = new_name
+        sync_user_feed(class_id=cls.id)
         db.session.commit()
         flash("Klassnamnet har uppdaterats.")
         return redirect(url_for('index', class_id=cls.id))
@@ -934,6 +2434,7 @@ def leave_class(class_id):
 
     if membership:
         db.session.delete(membership)
+        sync_user_feed(user_id=user.id, class_id=cls.id)
         db.session.commit()
         flash("Du har lämnat klassen.")
     else:
@@ -946,54 +2447,41 @@ from datetime import datetime, timedelta
 @app.route('/subject/<int:subject_id>')
 @login_required
 def view_subject(subject_id):
+    user = current_user()
+
+    etag = page_etag(user, data_version_token(user.id, subject_id=subject_id), 'subject', subject_id)
+    cached_response = not_modified(etag)
+    if cached_response is not None:
+        return cached_response
+
     subject = Subject.query.get_or_404(subject_id)
     cls = subject.cls
-    user = current_user()
     membership = ClassMember.query.filter_by(user_id=user.id, class_id=cls.id).first()
     is_admin = membership and membership.role == 'admin'
     
     # Samla uppgifter/prov med färg baserat på deadline
+    now = datetime.now()
     assignments_display = []
     for a in subject.assignments:
-        # Standardfärg
-        color = "#f8f9fa"
-    
-        if a.deadline:
-            now = datetime.now()
-            delta = a.deadline - now
-            days_left = delta.days + (delta.seconds / 86400)
-            if days_left > 14:
-                color = "#44ce1b"  # långt borta
-            elif days_left > 7:
-                color = "#bbdb44"
-            elif days_left > 3:
-                color = "#fad928"
-            elif days_left > 1:
-                color = "#f2a134"
-            elif days_left > 0:
-                color = "#e51f1f"  # nära deadline
-            elif days_left < 0:
-                color = "#6a6af7"
-    
         assignments_display.append({
             'id': a.id,
             'title': a.title,
             'type': a.type,
             'deadline': a.deadline,
             'created_by': a.created_by,
-            'color': color
+            'color': deadline_color(a.deadline, now)
         })
 
     # Sortera uppgifter/prov efter deadline (närmast först)
     assignments_display.sort(key=lambda x: x['deadline'] or datetime.max)
 
-    return render_template_string(
+    return with_etag(render_page(
         SUBJECT_TEMPLATE,
         subject=subject,
         class_data=cls,
         assignments=assignments_display,
         is_admin=is_admin
-    )
+    ), etag)
 
 @app.route('/edit_subject/<int:subject_id>', methods=['GET', 'POST'])
 @login_required
@@ -1014,6 +2502,7 @@ def edit_subject(subject_id):
             return redirect(url_for('edit_subject', subject_id=subject_id))
 
         subject.name = new_name
+        sync_user_feed(class_id=cls.id, subject_id=subject.id)
         db.session.commit()
         flash("Ämnesnamnet har uppdaterats.")
         return redirect(url_for('index', class_id=cls.id))
@@ -1035,6 +2524,7 @@ def delete_subject(subject_id):
     for assignment in subject.assignments:
         db.session.delete(assignment)
     db.session.delete(subject)
+    sync_user_feed(class_id=cls.id, subject_id=subject_id)
     db.session.commit()
 
     flash(f"Ämnet '{subject.name}' har raderats.")
@@ -1075,7 +2565,11 @@ def edit_assignment(assignment_id):
 
         assignment.title = new_title
         assignment.type = new_type
+        if new_deadline != assignment.deadline:
+            assignment.next_notify_at = next_notify_at(new_deadline, datetime.now())
         assignment.deadline = new_deadline
+        sync_user_feed(class_id=cls.id, assignment_id=assignment.id)
+        record_feed_change(cls.id, 'assignment', assignment.id, 'upsert')
         db.session.commit()
         flash("Uppgiften/provet har uppdaterats.")
         return redirect(url_for('index', subject_id=subj.id))
@@ -1104,6 +2598,7 @@ def delete_class(class_id):
 
     ClassMember.query.filter_by(class_id=cls.id).delete()
     db.session.delete(cls)
+    sync_user_feed(class_id=class_id)
     db.session.commit()
 
     flash(f"Klassen '{cls.name}' har raderats.")
@@ -1272,6 +2767,7 @@ def add_admin_request(class_id):
 
         # For now, directly make them admin (later you can generate a token/link)
         target_membership.role = 'admin'
+        sync_user_feed(user_id=target_user.id, class_id=class_id)
         db.session.commit()
         flash(f"{target_user.name} är nu admin i klassen!", "success")
         return redirect(url_for('view_class', class_id=class_id))
@@ -1289,15 +2785,10 @@ def forgot_password():
             token = serializer.dumps(user.email, salt='reset-password')
             user.reset_password_token = token
             user.reset_password_expires = datetime.utcnow() + timedelta(hours=1)
-            db.session.commit()
 
             reset_url = url_for('reset_password', token=token, _external=True)
 
-            msg = Message(
-                "Återställ ditt lösenord",
-                recipients=[user.email]
-            )
-            msg.body = f"""
+            enqueue_email(user.email, "Återställ ditt lösenord", f"""
 Hej {user.name},
 
 Du har begärt att återställa ditt lösenord.
@@ -1306,8 +2797,8 @@ Klicka på länken nedan (giltig i 1 timme):
 {reset_url}
 
 Om du inte begärde detta kan du ignorera mailet.
-"""
-            mail.send(msg)
+""")
+            db.session.commit()
 
         flash("Om kontot finns har vi skickat instruktioner till din e-post.", "info")
         return redirect(url_for('login'))
@@ -1370,6 +2861,7 @@ def leave_admin(class_id):
         return redirect(url_for('view_class', class_id=class_id))
 
     membership.role = 'member'
+    sync_user_feed(user_id=user.id, class_id=class_id)
     db.session.commit()
 
     flash("Du är inte längre admin i klassen.", "success")
@@ -1406,6 +2898,8 @@ def create_activity():
         )
 
         db.session.add(activity)
+        db.session.flush()
+        sync_user_feed(user_id=activity.user_id, activity_id=activity.id)
         db.session.commit()
         flash("Aktivitet skapad!", "success")
         return redirect(url_for('index'))
@@ -1434,6 +2928,7 @@ def edit_activity(activity_id):
         activity.start_time = datetime.fromisoformat(start_time)
         activity.end_time = datetime.fromisoformat(end_time)
 
+        sync_user_feed(user_id=activity.user_id, activity_id=activity.id)
         db.session.commit()
         flash("Aktiviteten uppdaterades!", "success")
         return redirect(url_for('index'))
@@ -1449,6 +2944,7 @@ def delete_activity(activity_id):
         abort(403)
 
     db.session.delete(activity)
+    sync_user_feed(user_id=activity.user_id, activity_id=activity_id)
     db.session.commit()
 
     flash("Aktiviteten raderades", "success")
@@ -1464,25 +2960,59 @@ def update_skill(subject_id): # Namnet här måste vara 'update_skill'
     
     if skill:
         skill.level = level
+        skill.skill_factor = skill_factor_for(level)
     else:
-        new_skill = SubjectSkill(user_id=current_user().id, subject_id=subject_id, level=level)
+        new_skill = SubjectSkill(user_id=current_user().id, subject_id=subject_id, level=level,
+                                 skill_factor=skill_factor_for(level))
         db.session.add(new_skill)
     
+    sync_user_feed(user_id=current_user().id, subject_id=subject_id)
     db.session.commit()
     
     # Hitta klassens ID så vi kan skicka användaren tillbaka till rätt ställe
     subj = Subject.query.get_or_404(subject_id)
     return redirect(url_for('view_class', class_id=subj.class_id))
 
-@app.route('/set_mode/<mode>')
+@app.route('/set_mode/<mode>', methods=['GET', 'POST'])
 def set_dashboard_mode(mode):
     if not current_user(): return redirect(url_for('login'))
-    if mode in ['sista_minuten', 'planerare']:
+    if mode in DASHBOARD_MODES:
         user = current_user()
         user.dashboard_mode = mode
         db.session.commit()
+    # POST kommer från översiktens lägesknappar som redan sorterat om listan
+    if request.method == 'POST':
+        return '', 204
     return redirect(url_for('index'))
 
+def fragment_response(source, *parts, **context):
+    """En HTML-bit som översikten hämtar först när den behövs.
+
+    Valideras som sidorna (page_etag): mallen, dess indata och användarens
+    datatoken ingår, så en ny deploy eller ändrad data ger en ny version.
+    """
+    user = current_user()
+    etag = page_etag(user, data_version_token(user.id), source, *parts)
+    cached_response = not_modified(etag)
+    if cached_response is not None:
+        return cached_response
+
+    return with_etag(render_template(page_template(source), **context), etag)
+
+@app.route('/fragments/guide')
+@login_required
+def guide_fragment():
+    user = current_user()
+    is_any_admin = db.session.query(
+        ClassMember.query.filter_by(user_id=user.id, role='admin').exists()
+    ).scalar()
+    return fragment_response(GUIDE_FRAGMENT, is_any_admin, is_any_admin=is_any_admin)
+
+@app.route('/fragments/study-plan')
+@login_required
+def study_plan_fragment():
+    return fragment_response(STUDY_PLAN_FRAGMENT)
+
 @app.route('/mark_guide_seen', methods=['POST'])
 @login_required
 def mark_guide_seen():
@@ -1490,6 +3020,13 @@ def mark_guide_seen():
     db.session.commit()
     return '', 204
 
+@app.route('/metrics')
+def metrics():
+    token = app.config['METRICS_TOKEN']
+    if token and request.args.get('token') != token:
+        return '', 403
+    return jsonify(dict(METRICS))
+
 @app.route('/generate_plan', methods=['POST'])
 def generate_plan():
     try:
@@ -1623,6 +3160,54 @@ def generate_plan():
         print(f"FEL: {e}")
         return jsonify({"success": False, "error": str(e)}), 500
 
+# ---------- Schemalagda jobb ----------
+@scheduler.task('interval', id='purge_expired_assignments',
+                minutes=app.config['EXPIRED_PURGE_INTERVAL_MINUTES'], max_instances=1, coalesce=True)
+def scheduled_purge_expired_assignments():
+    with app.app_context():
+        purge_expired_assignments()
+
+@scheduler.task('interval', id='prune_feed_changes', minutes=10, max_instances=1, coalesce=True)
+def scheduled_prune_feed_changes():
+    with app.app_context():
+        prune_feed_changes()
+
+if app.config['ACTIVITY_RETENTION_DAYS']:
+    @scheduler.task('interval', id='archive_past_activities', hours=6, max_instances=1, coalesce=True)
+    def scheduled_archive_past_activities():
+        with app.app_context():
+            archive_past_activities()
+
+# ---------- CLI-kommandon ----------
+@app.cli.command('purge-expired')
+@click.option('--grace-days', type=int, default=None, help="Dagar efter deadline innan en uppgift rensas.")
+def purge_expired_command(grace_days):
+    """Rensar utgångna uppgifter (samma jobb som schemaläggaren kör)."""
+    purge_expired_assignments(grace_days)
+
+@app.cli.command('archive-activities')
+@click.option('--retention-days', type=int, default=None, help="Dagar efter slut innan en aktivitet arkiveras.")
+def archive_activities_command(retention_days):
+    """Flyttar gamla aktiviteter till activity_archive."""
+    if retention_days is None and not app.config['ACTIVITY_RETENTION_DAYS']:
+        raise click.UsageError("Ange --retention-days eller sätt ACTIVITY_RETENTION_DAYS.")
+    archive_past_activities(retention_days)
+
+@app.cli.command('rebuild-user-feed')
+@click.option('--check', is_flag=True, help="Jämför bara user_feed med grundtabellerna, skriv inget.")
+def rebuild_user_feed_command(check):
+    """Bygger om översiktstabellen user_feed från grunden."""
+    if check:
+        missing, extra = check_user_feed()
+        print(f"user_feed: {len(missing)} saknade och {len(extra)} överflödiga rader.")
+        if missing or extra:
+            raise SystemExit(1)
+        return
+
+    start = datetime.now()
+    count = rebuild_user_feed()
+    print(f"user_feed ombyggd: {count} rader på {(datetime.now() - start).total_seconds():.2f} s.")
+
 # ---------- Templates ----------
 # För enkelhet använder jag inline templates. Byt gärna till riktiga filer senare.
 HOME_TEMPLATE = """
@@ -2225,6 +3810,9 @@ DASH_TEMPLATE = """
             font-weight: bold;
             color: #1a7f37;
         }
+        .flash-message.warning {
+            color: #664d03;
+        }
 
         .hidden-class {
             background-color: #222 !important;
@@ -2241,6 +3829,12 @@ DASH_TEMPLATE = """
             background-color: #222 !important;
             color: white !important;
         }
+        .assignments li.mode-hidden {
+            display: none;
+        }
+        [data-countdown] [hidden] {
+            display: none !important;
+        }
 
         button {
             cursor: pointer;
@@ -2499,14 +4093,14 @@ DASH_TEMPLATE = """
         
             <span style="font-size: 0.8em; color: white; font-weight: bold; letter-spacing: 0.5px;">VÄLJ:</span>
             
-            <a href="{{ url_for('set_dashboard_mode', mode='sista_minuten') }}" 
+            <a href="{{ url_for('set_dashboard_mode', mode='sista_minuten') }}" class="mode-toggle" data-mode="sista_minuten" data-color="#dc3545"
                style="background: {{ '#dc3545' if user.dashboard_mode == 'sista_minuten' else 'transparent' }}; 
                       padding: 5px 12px; font-size: 0.8em; border-radius: 15px; color: white; 
                       text-decoration: none; border: 1px solid {{ '#dc3545' if user.dashboard_mode == 'sista_minuten' else 'rgba(255,255,255,0.2)' }};">
                 🔥 Sista minuten
             </a>
         
-            <a href="{{ url_for('set_dashboard_mode', mode='planerare') }}" 
+            <a href="{{ url_for('set_dashboard_mode', mode='planerare') }}" class="mode-toggle" data-mode="planerare" data-color="#28a745"
                style="background: {{ '#28a745' if user.dashboard_mode == 'planerare' else 'transparent' }}; 
                       padding: 5px 12px; font-size: 0.8em; border-radius: 15px; color: white; 
                       text-decoration: none; border: 1px solid {{ '#28a745' if user.dashboard_mode == 'planerare' else 'rgba(255,255,255,0.2)' }};">
@@ -2516,26 +4110,40 @@ DASH_TEMPLATE = """
         
     </nav>
 
+    {% set dashboard = load_dashboard() %}
+    {% set classes = dashboard.classes %}
+    {% set assignments = dashboard.assignments %}
+    {% set is_any_admin = dashboard.is_any_admin %}
+    {% set top_assignment = dashboard.top_assignment %}
+    {% set next_cursors = dashboard.next_cursors %}
+
     <div class="container">
         <div class="dashboard-card">
 
             {% with messages = get_flashed_messages() %}
             {% endwith %}
+
+            {% if dashboard.stale %}
+            <div class="flash-message warning">
+                Översikten uppdateras just nu och kan sakna de senaste ändringarna.
+                <a href="{{ url_for('index') }}">Ladda om</a>
+            </div>
+            {% endif %}
         
-            {% if top_assignment %}
-            <div id="focus-countdown" style="background: linear-gradient(135deg, #003C58 0%, #005a84 100%); color: white; padding: 25px; border-radius: 20px; margin-bottom: 30px; text-align: center; box-shadow: 0 10px 25px rgba(0,0,0,0.2); position: relative; overflow: hidden;">
+            {# Renderas alltid så att ett lägesbyte i klienten kan visa/byta fokusuppgift #}
+            <div id="focus-countdown" data-countdown="{{ top_assignment.deadline.strftime('%Y-%m-%dT%H:%M:%S') if top_assignment else '' }}" style="background: linear-gradient(135deg, #003C58 0%, #005a84 100%); color: white; padding: 25px; border-radius: 20px; margin-bottom: 30px; text-align: center; box-shadow: 0 10px 25px rgba(0,0,0,0.2); position: relative; overflow: hidden;{{ '' if top_assignment else ' display: none;' }}">
                 <div style="position: absolute; top: -10px; right: -10px; font-size: 5em; opacity: 0.1;">⭐</div>
                 <h3 style="margin: 0; font-size: 0.8em; text-transform: uppercase; letter-spacing: 2px; opacity: 0.8; color: white;">Ditt största fokus just nu</h3>
-                <h2 style="margin: 10px 0; font-size: 1.6em; color: white;">{{ top_assignment.title }}</h2>
+                <h2 id="focus-title" style="margin: 10px 0; font-size: 1.6em; color: white;">{{ top_assignment.title if top_assignment else '' }}</h2>
                 
-                <div id="timer-display" style="display: flex; justify-content: center; gap: 10px; margin-top: 15px;">
-                    <div class="time-unit"><span id="days" style="font-size: 1.8em; font-weight: bold; display: block;">--</span> dagar</div>
-                    <div class="time-unit"><span id="hours" style="font-size: 1.8em; font-weight: bold; display: block;">--</span> tim</div>
-                    <div class="time-unit"><span id="minutes" style="font-size: 1.8em; font-weight: bold; display: block;">--</span> min</div>
-                    <div class="time-unit"><span id="seconds" style="font-size: 1.8em; font-weight: bold; display: block;">--</span> sek</div>
+                <div id="timer-display" class="countdown-units" style="display: flex; justify-content: center; gap: 10px; margin-top: 15px;">
+                    <div class="time-unit"><span data-unit="days" style="font-size: 1.8em; font-weight: bold; display: block;">--</span> dagar</div>
+                    <div class="time-unit"><span data-unit="hours" style="font-size: 1.8em; font-weight: bold; display: block;">--</span> tim</div>
+                    <div class="time-unit"><span data-unit="minutes" style="font-size: 1.8em; font-weight: bold; display: block;">--</span> min</div>
+                    <div class="time-unit"><span data-unit="seconds" style="font-size: 1.8em; font-weight: bold; display: block;">--</span> sek</div>
                 </div>
+                <h2 class="countdown-done" style="margin: 15px 0 0; color: white;" hidden>Deadline uppnådd! 🏁</h2>
             </div>
-            {% endif %}
         
             <div class="section">
                 <div style="display:flex; justify-content:space-between; align-items:center; margin-bottom:10px;">
@@ -2575,8 +4183,11 @@ DASH_TEMPLATE = """
                 <h3>Kommande uppgifter & aktiviteter</h3>
                 <ul class="assignments">
                 {% for a in assignments %}
+                    {% set mode_class = '' if user.dashboard_mode in a.feed_modes else 'mode-hidden' %}
                     {% if a.type == 'assignment' %}
-                        <li data-class-id="{{ a['class_id'] }}" style="background-color: {{ a['color'] }};">
+                        <li data-class-id="{{ a['class_id'] }}" class="{{ mode_class }}" style="background-color: {{ a['color'] }};"
+                            data-feed-key="assignment-{{ a['id'] }}" data-modes="{{ a.feed_modes|join(' ') }}" data-scores='{{ a.scores|tojson }}'
+                            data-title="{{ a['title'] }}" data-deadline="{{ a['deadline'].strftime('%Y-%m-%dT%H:%M:%S') if a['deadline'] else '' }}">
                             <span>
                                 {% if loop.first %}
                                 <div class="star-tooltip">
@@ -2593,7 +4204,7 @@ DASH_TEMPLATE = """
                                     — deadline: {{ a['deadline'].strftime('%Y/%m/%d %H:%M') }}
                                 {% endif %}
 
-                                <button class="study-plan-trigger" onclick="checkMathSubject('{{ a.title }}')">🚀 Aktivera studieplan</button>
+                                <button class="study-plan-trigger" onclick="openStudyPlan('{{ a.title }}')">🚀 Aktivera studieplan</button>
                             </span>
                             {% if a['role'] == 'admin' %}
                                 <span>
@@ -2605,7 +4216,8 @@ DASH_TEMPLATE = """
                             {% endif %}
                         </li>
                     {% elif a.type == 'activity' %}
-                        <li style="background-color: {{ a['color'] }}; color: #003C58; font-weight: bold; border: 1px solid rgba(0,0,0,0.1);">
+                        <li class="{{ mode_class }}" style="background-color: {{ a['color'] }}; color: #003C58; font-weight: bold; border: 1px solid rgba(0,0,0,0.1);"
+                            data-feed-key="activity-{{ a['id'] }}" data-modes="{{ a.feed_modes|join(' ') }}" data-scores='{{ a.scores|tojson }}'>
                             <span>
                                 {% if loop.first %}
                                 <div class="star-tooltip">
@@ -2633,6 +4245,7 @@ DASH_TEMPLATE = """
                     <li>Inga uppgifter eller aktiviteter hittades.</li>
                 {% endfor %}
                 </ul>
+                <div id="feed-sentinel" data-cursors='{{ next_cursors|tojson }}' style="text-align:center; color:#999; font-size:0.85em; padding:10px;"></div>
             </div>
 
             <div class="section">
@@ -2665,211 +4278,320 @@ DASH_TEMPLATE = """
             });
         });
     
-        // --- NY LOGIK FÖR STUDIEPLAN ---
-        let activeAssignmentTitle = "";
-    
-        function checkMathSubject(title) {
-            activeAssignmentTitle = title;
-            // Öppna modalen och visa steg 0 (Frågan)
-            document.getElementById('studyPlanModal').style.display = 'flex';
-            nextStep(0); 
-        }
-    
-        function handleMathConfirm(isMath) {
-            if (isMath) {
-                // 1. Uppdatera texten i nästa steg så användaren ser vilken uppgift det gäller
-                const displayTitle = document.getElementById('display-title');
-                if (displayTitle) {
-                    displayTitle.innerText = activeAssignmentTitle;
-                }
-                
-                // 2. Gå till Steg 1 (Kurs & Material)
-                nextStep(1);
-            } else {
-                alert("PlugIt+ Studieplanerare stöder just nu endast matematik. Håll utkik efter fler ämnen snart!");
-                closeStudyModal();
+        // --- "Ladda fler": hämta nästa sida av flödet när listans slut syns ---
+        function escapeHtml(text) {
+            const div = document.createElement('div');
+            div.textContent = text == null ? '' : String(text);
+            return div.innerHTML;
+        }
+
+        function formatDateTime(iso) {
+            // Samma format som mallen: ÅÅÅÅ/MM/DD TT:MM
+            return iso ? iso.slice(0, 10).replace(/-/g, '/') + ' ' + iso.slice(11, 16) : '';
+        }
+
+        function renderFeedItem(item, mode) {
+            const li = document.createElement('li');
+            li.style.backgroundColor = item.color;
+            li.dataset.feedKey = item.type + '-' + item.id;
+            li.dataset.modes = mode;
+            li.dataset.scores = JSON.stringify(item.scores);
+
+            let actions = '';
+            if (item.edit_url) {
+                actions = `<span>
+                    <a class="button-link" href="${item.edit_url}"><button class="edit-btn">Ändra</button></a>
+                    <form method="post" action="${item.delete_url}" style="display:inline;" onsubmit="return confirm('Är du säker på att du vill radera?');">
+                        <button type="submit" class="delete-btn">Radera</button>
+                    </form>
+                </span>`;
+            }
+
+            if (item.type === 'activity') {
+                li.style.cssText += 'color: #003C58; font-weight: bold; border: 1px solid rgba(0,0,0,0.1);';
+                li.innerHTML = `<span>${escapeHtml(item.title)} — Start: ${formatDateTime(item.start_time)} | Slut: ${formatDateTime(item.end_time)}</span>` + actions;
+                return li;
+            }
+
+            li.dataset.classId = item.class_id;
+            li.dataset.title = item.title;
+            li.dataset.deadline = item.deadline ? item.deadline.slice(0, 19) : '';
+            const classCard = document.getElementById('class-' + item.class_id);
+            if (classCard && classCard.classList.contains('hidden-class')) {
+                li.classList.add('hidden-class');
+            }
+            li.innerHTML = `<span>
+                    <strong>${escapeHtml(item.title)}</strong> — ${escapeHtml(item.subject_name)} (${escapeHtml(item.class_name)})
+                    ${item.deadline ? '— deadline: ' + formatDateTime(item.deadline) : ''}
+                    <button class="study-plan-trigger">🚀 Aktivera studieplan</button>
+                </span>` + actions;
+            li.querySelector('.study-plan-trigger').addEventListener('click', () => openStudyPlan(item.title));
+            return li;
+        }
+
+        // --- Lägesbyte utan omladdning ---
+        // Varje objekt bär sina poäng för alla lägen (data-scores) och vilka lägens
+        // inlästa sidor det hör till (data-modes); ett byte sorterar bara om listan.
+        const feedList = document.querySelector('ul.assignments');
+        const feedSentinel = document.getElementById('feed-sentinel');
+        const feedCursors = feedSentinel ? JSON.parse(feedSentinel.dataset.cursors) : {};
+        let activeMode = '{{ user.dashboard_mode }}';
+
+        function feedItems() {
+            return Array.from(feedList.querySelectorAll('li[data-feed-key]'));
+        }
+
+        function inMode(li, mode) {
+            return li.dataset.modes.split(' ').includes(mode);
+        }
+
+        function markTopItem() {
+            feedList.querySelectorAll('.star-tooltip').forEach(star => star.remove());
+            const top = feedItems().find(li => inMode(li, activeMode));
+            if (top) {
+                const text = top.dataset.feedKey.startsWith('activity')
+                    ? '<strong>Dagens viktigaste:</strong><br>Denna aktivitet kräver din uppmärksamhet nu.'
+                    : '<strong>Rekommenderat fokus:</strong><br>Baserat på din ' + (activeMode === 'sista_minuten' ? 'Sista minuten' : 'Planerar') + '-profil.';
+                top.firstElementChild.insertAdjacentHTML('afterbegin',
+                    '<div class="star-tooltip"><span style="margin-right: 8px; font-size: 1.2em;">⭐</span><span class="tooltip-text">' + text + '</span></div>');
+            }
+
+            // Fokusrutan visar översta objektet om det är en uppgift med deadline
+            const focus = document.getElementById('focus-countdown');
+            if (focus && focus.querySelector('#focus-title')) {
+                const hasDeadline = top && top.dataset.deadline;
+                focus.style.display = hasDeadline ? '' : 'none';
+                focus.dataset.countdown = hasDeadline ? top.dataset.deadline : '';
+                document.getElementById('focus-title').textContent = hasDeadline ? top.dataset.title : '';
+                if (typeof countdowns !== 'undefined') countdowns.refresh();
             }
         }
-    
-        // Definition av områden per kurs
-        const courseModules = {
-            "Matematik 1c": [
-                "Aritmetik - Om tal", "Hela tal", "Rationella och reella tal", "Tal i potensform", "Problemlösning (Aritmetik)",
-                "Procent", "Andelen, delen och det hela", "Procentuella förändringar", "Lån och index",
-                "Algebra", "Algebraiska uttryck", "Linjära ekvationer och olikheter", "Potensekvationer", "Formler och mönster", "Undersök och bevisa",
-                "Geometri", "Geometri och algebra", "Geometri och bevis", "Trigonometri (1c)", "Vektorer",
-                "Grafer och funktioner", "Linjära och exponentiella funktioner", "Funktioner och matematiska modeller",
-                "Sannolikhet och statistik", "Enkla slumpförsök", "Slumpförsök i flera steg", "Statistik"
-            ],
-            "Matematik 2c": [
-                "Algebra och linjära modeller", "Algebra och funktioner", "Räta linjens ekvation", "Modeller och anpassningar", "Linjära ekvationssystem",
-                "Algebra och ickelinjära modeller", "Algebraiska identiteter", "Andragradsekvationer", "Andragradsfunktioner", "Exponentialfunktioner och logaritmer",
-                "Geometri (2c)", "Vinklar", "Likformighet", "Koordinatgeometri",
-                "Statistik (2c)", "Statistiska metoder", "Spridning och fördelning", "Modellering"
-            ],
-            "Matematik 3c": [
-                "Algebra och funktioner", "Algebra och polynom", "Rationella uttryck", "Funktioner",
-                "Derivata", "Ändringskvoter och derivata", "Deriveringsregler", "Derivatan av exponentialfunktioner",
-                "Kurvor, derivata och integraler", "Derivatan och grafen", "Problemlösning med derivata", "Från derivata till funktion",
-                "Trigonometri", "Trigonometri i rätvinkliga trianglar", "Trigonometri och enhetscirkeln", "Trigonometri för godtyckliga trianglar"
-            ],
-            "Matematik 4": [
-                "Trigonometri", "Trigonometri och enhetscirkeln", "Trigonometriska formler", "Trigonometriska funktioner", "Radianer",
-                "Derivata (Matte 4)", "Deriveringsregler I", "Deriveringsregler II", "Tillämpningar av derivata", "Skissa grafer",
-                "Integraler", "Integraler och areor", "Tillämpningar av integraler",
-                "Komplexa tal", "Aritmetik med komplexa tal", "Komplexa tal i polär form", "Potenser och komplexa tal", "Polynomekvationer", "Bevis och bevismetoder"
-            ]
-        };
-        
-        function nextStep(step) {
-            // 1. Speciell logik för specifika steg INNAN vi byter vy
-            if (step === 12) {
-                renderModuleCheckboxes(); // VIKTIGT: Fyller listan innan vi visar den
+
+        function sortFeed() {
+            // Samma ordning som servern: högst poäng först, sedan typ och id
+            const keyed = feedItems().map(li => {
+                const [type, id] = li.dataset.feedKey.split('-');
+                return { li, type, id: Number(id), score: JSON.parse(li.dataset.scores)[activeMode], visible: inMode(li, activeMode) };
+            });
+            keyed.sort((a, b) => (b.visible - a.visible) || (b.score - a.score)
+                || (a.type < b.type ? -1 : a.type > b.type ? 1 : 0) || (a.id - b.id));
+            keyed.forEach(({ li, visible }) => {
+                li.classList.toggle('mode-hidden', !visible);
+                feedList.appendChild(li);
+            });
+            markTopItem();
+        }
+
+        function switchMode(mode) {
+            if (mode === activeMode) return;
+            activeMode = mode;
+            document.querySelectorAll('.mode-toggle').forEach(link => {
+                const active = link.dataset.mode === mode;
+                link.style.background = active ? link.dataset.color : 'transparent';
+                link.style.borderColor = active ? link.dataset.color : 'rgba(255,255,255,0.2)';
+            });
+            sortFeed();
+            if (feedSentinel) {
+                feedSentinel.dataset.cursor = feedCursors[mode] || '';
+                feedSentinel.dispatchEvent(new Event('cursorchange'));
             }
-        
-            if (step === 3) {
-                const container = document.getElementById('modules-container');
-                const selectedCourse = document.getElementById('course-select').value;
-                container.innerHTML = ""; 
-                
-                let modulesToShow = [];
-                
-                if (examType === 'full') {
-                    modulesToShow = courseModules[selectedCourse] || [];
-                } else {
-                    const checkedBoxes = document.querySelectorAll('.module-check:checked');
-                    checkedBoxes.forEach(cb => {
-                        modulesToShow.push(cb.value);
+            // Spara valet i bakgrunden; listan är redan omsorterad
+            fetch('{{ url_for('set_dashboard_mode', mode='') }}' + mode, { method: 'POST', keepalive: true }).catch(() => {});
+        }
+
+        if (feedList) {
+            document.querySelectorAll('.mode-toggle').forEach(link => {
+                link.addEventListener('click', event => {
+                    event.preventDefault();
+                    switchMode(link.dataset.mode);
+                });
+            });
+        }
+
+        (function setupFeedPaging() {
+            const sentinel = feedSentinel;
+            const list = feedList;
+            if (!sentinel || !list || !('IntersectionObserver' in window)) return;
+            sentinel.dataset.cursor = feedCursors[activeMode] || '';
+
+            let loading = false;
+            async function loadMore() {
+                if (loading || !sentinel.dataset.cursor) return;
+                loading = true;
+                const mode = activeMode;
+                sentinel.textContent = 'Laddar fler...';
+                try {
+                    const response = await fetch('{{ url_for('dashboard_feed') }}?cursor=' + encodeURIComponent(sentinel.dataset.cursor));
+                    const page = await response.json();
+                    page.items.forEach(item => {
+                        // Objekt som redan finns (från det andra läget) markeras bara som inlästa även här
+                        const existing = list.querySelector(`li[data-feed-key='${item.type}-${item.id}']`);
+                        if (existing) {
+                            if (!inMode(existing, mode)) existing.dataset.modes += ' ' + mode;
+                        } else {
+                            list.appendChild(renderFeedItem(item, mode));
+                        }
                     });
+                    feedCursors[mode] = page.next_cursor || '';
+                    if (mode === activeMode) sentinel.dataset.cursor = feedCursors[mode];
+                    sentinel.textContent = '';
+                    sortFeed();
+                } catch (error) {
+                    sentinel.textContent = 'Kunde inte ladda fler.';
+                    loading = false;
+                    return;
                 }
-        
-                if (modulesToShow.length === 0) {
-                    if (examType === 'partial') {
-                        alert("Du måste bocka i minst ett område i listan!");
-                        nextStep(12); 
-                    } else {
-                        alert("Kunde inte hitta några moduler. Gå tillbaka till början.");
-                        nextStep(1);
-                    }
-                    return; // STOPPA funktionen här så vi inte aktiverar steg 3
-                }
-        
-                // Rendera rullistorna
-                modulesToShow.forEach(module => {
-                    const div = document.createElement('div');
-                    div.style.marginBottom = "15px";
-                    div.innerHTML = `
-                        <label style="display:block; font-size:0.9em; margin-bottom:5px; font-weight:600;">${module}</label>
-                        <select class="module-rating" data-module="${module}" style="width: 100%; padding: 10px; border-radius: 8px; border: 1px solid #ddd;">
-                            <option value="1">🔴 Behöver lära mig grunderna</option>
-                            <option value="2">🟠 Kan lite grann</option>
-                            <option value="3">🟡 Bekväm med grunderna</option>
-                            <option value="4">🟢 Behärskar det bra</option>
-                        </select>
-                    `;
-                    container.appendChild(div);
-                });
+                loading = false;
+                // Fyllde sidan inte ut vyn syns sentinel fortfarande, och då triggar observern inte igen
+                if (sentinelVisible && sentinel.dataset.cursor) loadMore();
             }
-        
-            // 2. Visa/Dölj steg (Denna del körs bara om vi inte gjort en 'return' ovan)
-            document.querySelectorAll('.step').forEach(s => s.classList.remove('active'));
-            
-            // Hantera både siffror och strängar (t.ex. 12 eller '1-5')
-            const targetId = 'step' + step;
-            const target = document.getElementById(targetId);
-            
-            if (target) {
-                target.classList.add('active');
-                // Scrolla upp till toppen av modalen så användaren ser början på nästa steg
-                target.scrollTop = 0; 
-            } else {
-                console.error("Hittade inte elementet: " + targetId);
+
+            let sentinelVisible = false;
+            const observer = new IntersectionObserver(entries => {
+                sentinelVisible = entries[0].isIntersecting;
+                if (sentinelVisible) loadMore();
+            }, { rootMargin: '300px' });
+            // Efter ett lägesbyte kan sentinel redan synas utan att observern triggar igen
+            sentinel.addEventListener('cursorchange', () => { if (sentinelVisible) loadMore(); });
+            observer.observe(sentinel);
+        })();
+
+        {% if config['LIVE_FEED_ENABLED'] %}
+        // --- Live-uppdateringar: servern skickar deltan när en uppgift i ens klasser ändras ---
+        (function setupLiveFeed() {
+            if (!feedList || !('EventSource' in window)) return;
+            const feedModes = {{ modes|tojson }};
+            const source = new EventSource('{{ url_for('dashboard_stream') }}');
+
+            source.addEventListener('feed', event => {
+                const delta = JSON.parse(event.data);
+                const existing = feedList.querySelector(`li[data-feed-key='${delta.key}']`);
+                if (existing) existing.remove();
+
+                if (delta.op === 'upsert') {
+                    const li = renderFeedItem(delta.item, '');
+                    // Visa bara i lägen där objektet hamnar inom det som redan är inläst
+                    li.dataset.modes = feedModes.filter(mode =>
+                        !feedCursors[mode] || delta.ranks[mode] <= feedItems().filter(other => inMode(other, mode)).length + 1
+                    ).join(' ');
+                    feedList.querySelectorAll('li:not([data-feed-key])').forEach(placeholder => placeholder.remove());
+                    feedList.appendChild(li);
+                }
+                sortFeed();
+            });
+        })();
+        {% endif %}
+
+        // --- Guide och studieplan hämtas som fragment först när de behövs ---
+        const fragmentLoads = {};
+
+        function loadFragment(url) {
+            if (!fragmentLoads[url]) {
+                fragmentLoads[url] = fetch(url, { credentials: 'same-origin' })
+                    .then(response => {
+                        if (!response.ok) throw new Error(response.status);
+                        return response.text();
+                    })
+                    .then(html => {
+                        const container = document.createElement('div');
+                        container.innerHTML = html;
+                        // Skript som sätts in via innerHTML körs inte, så ersätt dem med nya
+                        container.querySelectorAll('script').forEach(old => {
+                            const script = document.createElement('script');
+                            script.textContent = old.textContent;
+                            old.replaceWith(script);
+                        });
+                        document.body.appendChild(container);
+                    });
+                fragmentLoads[url].catch(() => { delete fragmentLoads[url]; });
             }
+            return fragmentLoads[url];
         }
-    
-        function closeStudyModal() {
-            document.getElementById('studyPlanModal').style.display = 'none';
+
+        function openStudyPlan(title) {
+            loadFragment('{{ url_for('study_plan_fragment') }}').then(() => checkMathSubject(title));
         }
-    
-        // Samla in all data från de nya stegen
-        async function generateFinalPlan() {
-            // 1. Samla in all data från alla steg
-            const ratings = {};
-            document.querySelectorAll('.module-rating').forEach(select => {
-                ratings[select.dataset.module] = select.options[select.selectedIndex].text;
-            });
-        
-            const data = {
-                title: activeAssignmentTitle,
-                course: document.getElementById('course-select').value,
-                book: document.getElementById('book-select').value,
-                currentGrade: document.getElementById('current-grade').value,
-                targetGrade: document.getElementById('grade-goal').value,
-                hoursPerDay: document.getElementById('hours-range').value,
-                studyStyle: document.getElementById('study-style').value,
-                deadlineDate: document.getElementById('deadline-date').value,
-                todayDate: new Date().toISOString().split('T')[0],
-                moduleRatings: ratings
-            };
-        
-            // 2. VISA LADDNINGS-STEGET (Ersätt din gamla alert här)
-            nextStep("-loading"); // Anropar #step-loading
-        
-            try {
-                const response = await fetch('/generate_plan', {
-                    method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify(data)
-                });
-        
-                const result = await response.json();
-                
-                if (result.success) {
-                    console.log("Plan genererad:", result.plan);
-                    
-                    const resultContainer = document.getElementById('plan-result-content');
-                    resultContainer.innerHTML = ""; 
 
-                    // HÄR ÄR DEN NYA KODEN SOM RITAR UT AKTIVITETERNA
-                    result.plan.forEach((day) => {
-                        const stepDiv = document.createElement('div');
-                        stepDiv.style.cssText = "background: #f0f7fa; padding: 15px; border-radius: 12px; margin-bottom: 15px; border-left: 5px solid #0097CA;";
-                        
-                        // Skapa listan med aktiviteter (läs, räkna, video)
-                        let activityHtml = day.activities.map(act => {
-                            if(act.type === 'video') return `<li style="list-style:none;">🎥 <a href="${act.url}" target="_blank" style="color:#0097CA; text-decoration:none; font-weight:bold;">Se videogenomgång</a></li>`;
-                            if(act.type === 'läs') return `<li style="list-style:none;">📖 <b>Läs:</b> ${act.content}</li>`;
-                            if(act.type === 'räkna') return `<li style="list-style:none;">✏️ <b>Räkna:</b> ${act.content}</li>`;
-                            return `<li style="list-style:none;">• ${act.content}</li>`;
-                        }).join('');
+        function restartGuide() {
+            loadFragment('{{ url_for('guide_fragment') }}').then(() => openGuide(true));
+        }
 
-                        stepDiv.innerHTML = `
-                            <div style="color: #0097CA; font-weight: bold; font-size: 0.8em; margin-bottom: 5px;">📅 ${day.date}</div>
-                            <h4 style="margin: 0 0 10px 0; color: #003C58;">${day.title}</h4>
-                            <ul style="margin: 0; padding: 0; font-size: 0.9em; line-height: 1.6;">${activityHtml}</ul>
-                            <div style="margin-top: 10px; font-size: 0.8em; color: #666;">⏱️ Tid: ${day.time}</div>
-                        `;
-                        resultContainer.appendChild(stepDiv);
-                    });
+        {% if not user.has_seen_guide %}
+        loadFragment('{{ url_for('guide_fragment') }}').then(() => openGuide(false));
+        {% endif %}
+    </script>
 
-                    nextStep(5); // Gå till resultatvyn
-                } else {
-                    alert("Fel: " + result.error);
-                    nextStep(4); // Gå tillbaka om det sket sig
-                }
-            } catch (error) {
-                console.error("Fel:", error);
-                alert("Kunde inte kontakta servern.");
-                nextStep(4);
+    <script>
+    // En gemensam schemaläggare för alla nedräkningar på sidan ([data-countdown] med
+    // [data-unit]-fält). Den vaknar en gång per sekundskifte, skriver i nästa
+    // animationsram, rör bara fält vars text ändrats och står helt still när sidan är dold.
+    const countdowns = (() => {
+        const UNITS = [['days', 86400000, Infinity], ['hours', 3600000, 24], ['minutes', 60000, 60], ['seconds', 1000, 60]];
+        const rendered = new WeakMap();  // nod -> senast skrivna text
+        let timer = null, frame = null;
+
+        function setText(node, text) {
+            if (node && rendered.get(node) !== text) {
+                node.textContent = text;
+                rendered.set(node, text);
             }
         }
-    
-        // Uppdatera tim-displayen när man drar i slidern
-        function updateHourDisplay(val) {
-            document.getElementById('hour-val').innerText = val;
+
+        function setHidden(node, hidden) {
+            if (node && node.hidden !== hidden) node.hidden = hidden;
+        }
+
+        function render(el, now) {
+            const deadline = Date.parse(el.dataset.countdown);
+            if (isNaN(deadline)) return;
+            const t = deadline - now;
+            setHidden(el.querySelector('.countdown-units'), t < 0);
+            setHidden(el.querySelector('.countdown-done'), t >= 0);
+            if (t < 0) return;
+            for (const [unit, ms, wrap] of UNITS) {
+                setText(el.querySelector('[data-unit="' + unit + '"]'), String(Math.floor(t / ms) % wrap));
+            }
+        }
+
+        function tick() {
+            frame = null;
+            const now = Date.now();
+            document.querySelectorAll('[data-countdown]').forEach(el => {
+                // Dolda rutor (display: none) har ingen offsetParent och hoppas över
+                if (el.dataset.countdown && el.offsetParent !== null) render(el, now);
+            });
+            schedule();
+        }
+
+        function schedule() {
+            clearTimeout(timer);
+            timer = document.hidden ? null
+                : setTimeout(() => { frame = requestAnimationFrame(tick); }, 1000 - Date.now() % 1000);
+        }
+
+        function stop() {
+            clearTimeout(timer);
+            if (frame) cancelAnimationFrame(frame);
+            timer = frame = null;
+        }
+
+        // Rita om direkt, t.ex. när en ruta fått ny deadline eller sidan blivit synlig igen
+        function refresh() {
+            stop();
+            if (!document.hidden) frame = requestAnimationFrame(tick);
         }
+
+        document.addEventListener('visibilitychange', () => document.hidden ? stop() : refresh());
+        refresh();
+        return { refresh };
+    })();
     </script>
 
+</body>
+</html>
+"""
+
+STUDY_PLAN_FRAGMENT = """
     <div id="studyPlanModal" style="position: fixed; z-index: 10001; left: 0; top: 0; width: 100%; height: 100%; background-color: rgba(0,0,0,0.8); align-items: center; justify-content: center; backdrop-filter: blur(5px); display: none;">
         <div style="background: white; padding: 30px; border-radius: 20px; max-width: 500px; width: 95%; max-height: 90vh; overflow-y: auto; box-shadow: 0 10px 40px rgba(0,0,0,0.5); position: relative;">
             
@@ -3040,26 +4762,213 @@ DASH_TEMPLATE = """
         .step { display: none; }
         .step.active { display: block; }
     </style>
+
+    <script>
+    let examType = "full"; // Standardval
+
+        // --- NY LOGIK FÖR STUDIEPLAN ---
+        let activeAssignmentTitle = "";
     
-    <div id="guideModal" style="position: fixed; z-index: 10000; left: 0; top: 0; width: 100%; height: 100%; background-color: rgba(0,0,0,0.8); align-items: center; justify-content: center; backdrop-filter: blur(5px); display: {{ 'none' if user.has_seen_guide else 'flex' }};">
-        <div style="background: white; padding: 35px; border-radius: 20px; max-width: 500px; width: 90%; text-align: center; box-shadow: 0 10px 40px rgba(0,0,0,0.5); color: #333; position: relative;">
-            <div id="guide-content">
-                <h2 style="color: #003C58; margin-bottom: 15px;">Nyheter i Plugghubben! 🚀</h2>
-                <p style="line-height: 1.6;">Vi har gjort stora uppdateringar för att hjälpa dig planera din tid bättre. Vill du se hur det fungerar?</p>
+        function checkMathSubject(title) {
+            activeAssignmentTitle = title;
+            // Öppna modalen och visa steg 0 (Frågan)
+            document.getElementById('studyPlanModal').style.display = 'flex';
+            nextStep(0); 
+        }
+    
+        function handleMathConfirm(isMath) {
+            if (isMath) {
+                // 1. Uppdatera texten i nästa steg så användaren ser vilken uppgift det gäller
+                const displayTitle = document.getElementById('display-title');
+                if (displayTitle) {
+                    displayTitle.innerText = activeAssignmentTitle;
+                }
                 
-                <div style="margin-top: 25px; display: flex; gap: 12px; justify-content: center;">
-                    <button onclick="showStep(1)" style="background: #28a745; color: white; border: none; padding: 12px 25px; border-radius: 25px; cursor: pointer; font-weight: bold;">Ja, visa mig!</button>
-                    <button onclick="closeGuide()" style="background: #eee; color: #666; border: none; padding: 12px 25px; border-radius: 25px; cursor: pointer;">Hoppa över</button>
-                </div>
-            </div>
-            <div id="step-indicator" style="margin-top: 20px; font-size: 0.8em; color: #999; display: none;">Steg <span id="current-step">1</span> av 7</div>
-        </div>
-    </div>
+                // 2. Gå till Steg 1 (Kurs & Material)
+                nextStep(1);
+            } else {
+                alert("PlugIt+ Studieplanerare stöder just nu endast matematik. Håll utkik efter fler ämnen snart!");
+                closeStudyModal();
+            }
+        }
     
-    <script>
-    let examType = "full"; // Standardval
-    let currentStep = 0;
-    const isAdmin = {{ 'true' if is_any_admin else 'false' }};
+        // Definition av områden per kurs
+        const courseModules = {
+            "Matematik 1c": [
+                "Aritmetik - Om tal", "Hela tal", "Rationella och reella tal", "Tal i potensform", "Problemlösning (Aritmetik)",
+                "Procent", "Andelen, delen och det hela", "Procentuella förändringar", "Lån och index",
+                "Algebra", "Algebraiska uttryck", "Linjära ekvationer och olikheter", "Potensekvationer", "Formler och mönster", "Undersök och bevisa",
+                "Geometri", "Geometri och algebra", "Geometri och bevis", "Trigonometri (1c)", "Vektorer",
+                "Grafer och funktioner", "Linjära och exponentiella funktioner", "Funktioner och matematiska modeller",
+                "Sannolikhet och statistik", "Enkla slumpförsök", "Slumpförsök i flera steg", "Statistik"
+            ],
+            "Matematik 2c": [
+                "Algebra och linjära modeller", "Algebra och funktioner", "Räta linjens ekvation", "Modeller och anpassningar", "Linjära ekvationssystem",
+                "Algebra och ickelinjära modeller", "Algebraiska identiteter", "Andragradsekvationer", "Andragradsfunktioner", "Exponentialfunktioner och logaritmer",
+                "Geometri (2c)", "Vinklar", "Likformighet", "Koordinatgeometri",
+                "Statistik (2c)", "Statistiska metoder", "Spridning och fördelning", "Modellering"
+            ],
+            "Matematik 3c": [
+                "Algebra och funktioner", "Algebra och polynom", "Rationella uttryck", "Funktioner",
+                "Derivata", "Ändringskvoter och derivata", "Deriveringsregler", "Derivatan av exponentialfunktioner",
+                "Kurvor, derivata och integraler", "Derivatan och grafen", "Problemlösning med derivata", "Från derivata till funktion",
+                "Trigonometri", "Trigonometri i rätvinkliga trianglar", "Trigonometri och enhetscirkeln", "Trigonometri för godtyckliga trianglar"
+            ],
+            "Matematik 4": [
+                "Trigonometri", "Trigonometri och enhetscirkeln", "Trigonometriska formler", "Trigonometriska funktioner", "Radianer",
+                "Derivata (Matte 4)", "Deriveringsregler I", "Deriveringsregler II", "Tillämpningar av derivata", "Skissa grafer",
+                "Integraler", "Integraler och areor", "Tillämpningar av integraler",
+                "Komplexa tal", "Aritmetik med komplexa tal", "Komplexa tal i polär form", "Potenser och komplexa tal", "Polynomekvationer", "Bevis och bevismetoder"
+            ]
+        };
+        
+        function nextStep(step) {
+            // 1. Speciell logik för specifika steg INNAN vi byter vy
+            if (step === 12) {
+                renderModuleCheckboxes(); // VIKTIGT: Fyller listan innan vi visar den
+            }
+        
+            if (step === 3) {
+                const container = document.getElementById('modules-container');
+                const selectedCourse = document.getElementById('course-select').value;
+                container.innerHTML = ""; 
+                
+                let modulesToShow = [];
+                
+                if (examType === 'full') {
+                    modulesToShow = courseModules[selectedCourse] || [];
+                } else {
+                    const checkedBoxes = document.querySelectorAll('.module-check:checked');
+                    checkedBoxes.forEach(cb => {
+                        modulesToShow.push(cb.value);
+                    });
+                }
+        
+                if (modulesToShow.length === 0) {
+                    if (examType === 'partial') {
+                        alert("Du måste bocka i minst ett område i listan!");
+                        nextStep(12); 
+                    } else {
+                        alert("Kunde inte hitta några moduler. Gå tillbaka till början.");
+                        nextStep(1);
+                    }
+                    return; // STOPPA funktionen här så vi inte aktiverar steg 3
+                }
+        
+                // Rendera rullistorna
+                modulesToShow.forEach(module => {
+                    const div = document.createElement('div');
+                    div.style.marginBottom = "15px";
+                    div.innerHTML = `
+                        <label style="display:block; font-size:0.9em; margin-bottom:5px; font-weight:600;">${module}</label>
+                        <select class="module-rating" data-module="${module}" style="width: 100%; padding: 10px; border-radius: 8px; border: 1px solid #ddd;">
+                            <option value="1">🔴 Behöver lära mig grunderna</option>
+                            <option value="2">🟠 Kan lite grann</option>
+                            <option value="3">🟡 Bekväm med grunderna</option>
+                            <option value="4">🟢 Behärskar det bra</option>
+                        </select>
+                    `;
+                    container.appendChild(div);
+                });
+            }
+        
+            // 2. Visa/Dölj steg (Denna del körs bara om vi inte gjort en 'return' ovan)
+            document.querySelectorAll('.step').forEach(s => s.classList.remove('active'));
+            
+            // Hantera både siffror och strängar (t.ex. 12 eller '1-5')
+            const targetId = 'step' + step;
+            const target = document.getElementById(targetId);
+            
+            if (target) {
+                target.classList.add('active');
+                // Scrolla upp till toppen av modalen så användaren ser början på nästa steg
+                target.scrollTop = 0; 
+            } else {
+                console.error("Hittade inte elementet: " + targetId);
+            }
+        }
+    
+        function closeStudyModal() {
+            document.getElementById('studyPlanModal').style.display = 'none';
+        }
+    
+        // Samla in all data från de nya stegen
+        async function generateFinalPlan() {
+            // 1. Samla in all data från alla steg
+            const ratings = {};
+            document.querySelectorAll('.module-rating').forEach(select => {
+                ratings[select.dataset.module] = select.options[select.selectedIndex].text;
+            });
+        
+            const data = {
+                title: activeAssignmentTitle,
+                course: document.getElementById('course-select').value,
+                book: document.getElementById('book-select').value,
+                currentGrade: document.getElementById('current-grade').value,
+                targetGrade: document.getElementById('grade-goal').value,
+                hoursPerDay: document.getElementById('hours-range').value,
+                studyStyle: document.getElementById('study-style').value,
+                deadlineDate: document.getElementById('deadline-date').value,
+                todayDate: new Date().toISOString().split('T')[0],
+                moduleRatings: ratings
+            };
+        
+            // 2. VISA LADDNINGS-STEGET (Ersätt din gamla alert här)
+            nextStep("-loading"); // Anropar #step-loading
+        
+            try {
+                const response = await fetch('/generate_plan', {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify(data)
+                });
+        
+                const result = await response.json();
+                
+                if (result.success) {
+                    console.log("Plan genererad:", result.plan);
+                    
+                    const resultContainer = document.getElementById('plan-result-content');
+                    resultContainer.innerHTML = ""; 
+
+                    // HÄR ÄR DEN NYA KODEN SOM RITAR UT AKTIVITETERNA
+                    result.plan.forEach((day) => {
+                        const stepDiv = document.createElement('div');
+                        stepDiv.style.cssText = "background: #f0f7fa; padding: 15px; border-radius: 12px; margin-bottom: 15px; border-left: 5px solid #0097CA;";
+                        
+                        // Skapa listan med aktiviteter (läs, räkna, video)
+                        let activityHtml = day.activities.map(act => {
+                            if(act.type === 'video') return `<li style="list-style:none;">🎥 <a href="${act.url}" target="_blank" style="color:#0097CA; text-decoration:none; font-weight:bold;">Se videogenomgång</a></li>`;
+                            if(act.type === 'läs') return `<li style="list-style:none;">📖 <b>Läs:</b> ${act.content}</li>`;
+                            if(act.type === 'räkna') return `<li style="list-style:none;">✏️ <b>Räkna:</b> ${act.content}</li>`;
+                            return `<li style="list-style:none;">• ${act.content}</li>`;
+                        }).join('');
+
+                        stepDiv.innerHTML = `
+                            <div style="color: #0097CA; font-weight: bold; font-size: 0.8em; margin-bottom: 5px;">📅 ${day.date}</div>
+                            <h4 style="margin: 0 0 10px 0; color: #003C58;">${day.title}</h4>
+                            <ul style="margin: 0; padding: 0; font-size: 0.9em; line-height: 1.6;">${activityHtml}</ul>
+                            <div style="margin-top: 10px; font-size: 0.8em; color: #666;">⏱️ Tid: ${day.time}</div>
+                        `;
+                        resultContainer.appendChild(stepDiv);
+                    });
+
+                    nextStep(5); // Gå till resultatvyn
+                } else {
+                    alert("Fel: " + result.error);
+                    nextStep(4); // Gå tillbaka om det sket sig
+                }
+            } catch (error) {
+                console.error("Fel:", error);
+                alert("Kunde inte kontakta servern.");
+                nextStep(4);
+            }
+        }
+    
+        // Uppdatera tim-displayen när man drar i slidern
+        function updateHourDisplay(val) {
+            document.getElementById('hour-val').innerText = val;
+        }
 
     function setExamType(type) {
         examType = type;
@@ -3102,7 +5011,45 @@ DASH_TEMPLATE = """
             container.appendChild(div);
         });
     }
-    
+    </script>
+"""
+
+GUIDE_FRAGMENT = """
+    <style>
+        .guide-next {
+            background: #0097CA;
+            color: white;
+            border: none;
+            padding: 10px 25px;
+            border-radius: 25px;
+            cursor: pointer;
+            margin-top: 15px;
+            font-weight: bold;
+        }
+        .guide-next:hover { background: #003C58; }
+        #guide-content h3 { color: #003C58; margin-bottom: 10px; }
+        #guide-content p { font-size: 0.95em; line-height: 1.5; color: #555; }
+    </style>
+
+    <div id="guideModal" style="position: fixed; z-index: 10000; left: 0; top: 0; width: 100%; height: 100%; background-color: rgba(0,0,0,0.8); align-items: center; justify-content: center; backdrop-filter: blur(5px); display: none;">
+        <div style="background: white; padding: 35px; border-radius: 20px; max-width: 500px; width: 90%; text-align: center; box-shadow: 0 10px 40px rgba(0,0,0,0.5); color: #333; position: relative;">
+            <div id="guide-content">
+                <h2 style="color: #003C58; margin-bottom: 15px;">Nyheter i Plugghubben! 🚀</h2>
+                <p style="line-height: 1.6;">Vi har gjort stora uppdateringar för att hjälpa dig planera din tid bättre. Vill du se hur det fungerar?</p>
+                
+                <div style="margin-top: 25px; display: flex; gap: 12px; justify-content: center;">
+                    <button onclick="showStep(1)" style="background: #28a745; color: white; border: none; padding: 12px 25px; border-radius: 25px; cursor: pointer; font-weight: bold;">Ja, visa mig!</button>
+                    <button onclick="closeGuide()" style="background: #eee; color: #666; border: none; padding: 12px 25px; border-radius: 25px; cursor: pointer;">Hoppa över</button>
+                </div>
+            </div>
+            <div id="step-indicator" style="margin-top: 20px; font-size: 0.8em; color: #999; display: none;">Steg <span id="current-step">1</span> av 7</div>
+        </div>
+    </div>
+
+    <script>
+    let currentStep = 0;
+    const isAdmin = {{ 'true' if is_any_admin else 'false' }};
+
     function showStep(step) {
         currentStep = step;
         const content = document.getElementById('guide-content');
@@ -3162,57 +5109,13 @@ DASH_TEMPLATE = """
         if (modal) modal.style.display = 'none';
         fetch('/mark_guide_seen', { method: 'POST' });
     }
-    
-    function restartGuide() {
-        const modal = document.getElementById('guideModal');
-        if (modal) {
-            modal.style.display = 'flex';
-            showStep(1);
-        }
-    }
 
-    {% if top_assignment and top_assignment.deadline %}
-    const deadline = new Date("{{ top_assignment.deadline.strftime('%Y-%m-%dT%H:%M:%S') }}").getTime();
-    
-    function updateTimer() {
-        const now = new Date().getTime();
-        const t = deadline - now;
-    
-        if (t >= 0) {
-            document.getElementById("days").innerText = Math.floor(t / (1000 * 60 * 60 * 24));
-            document.getElementById("hours").innerText = Math.floor((t % (1000 * 60 * 60 * 24)) / (1000 * 60 * 60));
-            document.getElementById("minutes").innerText = Math.floor((t % (1000 * 60 * 60)) / (1000 * 60));
-            document.getElementById("seconds").innerText = Math.floor((t % (1000 * 60)) / 1000);
-        } else {
-            document.getElementById("focus-countdown").innerHTML = "<h2>Deadline uppnådd! 🏁</h2>";
-        }
+    // Öppnas av översikten: introt för nya användare, steg 1 när guiden startas om
+    function openGuide(fromStart) {
+        document.getElementById('guideModal').style.display = 'flex';
+        if (fromStart) showStep(1);
     }
-    
-    setInterval(updateTimer, 1000);
-    updateTimer();
-    {% endif %}
     </script>
-    
-    <style>
-        .guide-next {
-            background: #0097CA;
-            color: white;
-            border: none;
-            padding: 10px 25px;
-            border-radius: 25px;
-            cursor: pointer;
-            margin-top: 15px;
-            font-weight: bold;
-        }
-        .guide-next:hover { background: #003C58; }
-        #guide-content h3 { color: #003C58; margin-bottom: 10px; }
-        #guide-content p { font-size: 0.95em; line-height: 1.5; color: #555; }
-    </style>
-
-    
-    
-</body>
-</html>
 """
 
 CREATE_CLASS_TEMPLATE = """
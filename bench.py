@@ -0,0 +1,322 @@
+"""Mikrobenchmarks för prestandakritiska delar av appen.
+
+Körs mot en egen databas i minnet (aldrig DATABASE_URL):
+
+    python bench.py            # alla benchmarks
+    python bench.py scoring    # bara en
+"""
+import os
+import sys
+
+os.environ['DATABASE_URL'] = os.environ.get('BENCH_DATABASE_URL', 'sqlite://')
+os.environ.setdefault('GROQ_API_KEY', 'bench')
+
+import gzip
+import random
+import socketserver
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+import app as truetime
+
+
+def _timed(fn, repeat=3):
+    """Bästa väggklocktiden av `repeat` körningar, i sekunder."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_scoring():
+    """calculate_priority_score() per objekt mot score_batch() (NumPy och ren Python)."""
+    now = datetime.now()
+    rng = random.Random(42)
+    levels = list(truetime.SKILL_FACTORS)
+
+    print("objekt      per objekt    batch (python)   batch (numpy)")
+    for n in (100, 10_000, 1_000_000):
+        items, user_skills, weights = [], {}, []
+        for i in range(n):
+            due = now + timedelta(days=rng.uniform(-2, 60))
+            if i % 10 == 0:
+                items.append({'type': 'activity', 'start_time': due})
+                weights.append(1.0)
+            else:
+                subject_id = i % 97
+                user_skills[subject_id] = truetime.skill_factor_for(levels[subject_id % len(levels)])
+                weight = float(1 + subject_id % 4)
+                items.append({'type': 'assignment', 'deadline': due, 'subject_id': subject_id, 'weight': weight})
+                weights.append(weight)
+
+        deadlines = [(it.get('deadline') or it.get('start_time')).timestamp() for it in items]
+        kinds = [truetime.ITEM_KIND_ACTIVITY if it['type'] == 'activity' else truetime.ITEM_KIND_ASSIGNMENT
+                 for it in items]
+        skill_factors = [user_skills[it['subject_id']] if it['type'] == 'assignment' else 1.0 for it in items]
+
+        repeat = 1 if n >= 1_000_000 else 3
+        per_item = _timed(lambda: [truetime.calculate_priority_score(it, 'sista_minuten', user_skills)
+                                   for it in items], repeat)
+        python_batch = _timed(lambda: truetime._score_batch_python(
+            deadlines, weights, skill_factors, kinds, 'sista_minuten', now.timestamp()), repeat)
+
+        if truetime.np is not None:
+            columns = (truetime.np.asarray(deadlines), truetime.np.asarray(weights),
+                       truetime.np.asarray(skill_factors), truetime.np.asarray(kinds))
+            numpy_batch = _timed(lambda: truetime.score_batch(*columns, 'sista_minuten', now), repeat)
+            numpy_column = f"{numpy_batch * 1000:12.2f} ms"
+        else:
+            numpy_column = "   (ej installerat)"
+
+        print(f"{n:>9,}  {per_item * 1000:10.2f} ms  {python_batch * 1000:12.2f} ms  {numpy_column}")
+
+
+def _allocated(build):
+    """Bytes som ligger kvar allokerade efter build() (tracemalloc)."""
+    tracemalloc.start()
+    result = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return size
+
+
+def bench_feed_items(n=10_000):
+    """Minne för ett flöde med n objekt: FeedItem (__slots__) mot de gamla dictarna."""
+    now = datetime.now()
+    rows = []
+    for i in range(n):
+        due = now + timedelta(days=i % 60, minutes=i)
+        if i % 10 == 0:
+            rows.append(('activity', i, f'Aktivitet {i}', due, due + timedelta(hours=1)))
+        else:
+            rows.append(('assignment', i, f'Uppgift {i}', due, None))
+
+    def as_dicts():
+        items = []
+        for kind, item_id, title, due, end_time in rows:
+            if kind == 'activity':
+                items.append({
+                    'id': item_id, 'type': 'activity', 'title': title, 'start_time': due,
+                    'end_time': end_time, 'role': 'owner', 'color': '#7da0ff',
+                    'priority_score': 1.0, 'scores': {'sista_minuten': 1.0, 'planerare': 1.0},
+                })
+            else:
+                items.append({
+                    'id': item_id, 'title': title, 'type': 'assignment', 'deadline': due,
+                    'subject_name': 'Ämne', 'subject_id': 1, 'weight': 2.0, 'class_name': 'Klass',
+                    'class_id': 1, 'created_by': 1, 'color': truetime.deadline_color(due, now),
+                    'role': 'member', 'assignment_type': 'assignment', 'priority_score': 1.0,
+                    'scores': {'sista_minuten': 1.0, 'planerare': 1.0},
+                })
+        return items
+
+    def as_feed_items():
+        return [
+            truetime.FeedItem(
+                kind, item_id, title, due, now, end_time=end_time,
+                subject_id=None if kind == 'activity' else 1,
+                subject_name=None if kind == 'activity' else 'Ämne',
+                class_id=None if kind == 'activity' else 1,
+                class_name=None if kind == 'activity' else 'Klass',
+                created_by=None if kind == 'activity' else 1,
+                assignment_type=None if kind == 'activity' else 'assignment',
+                weight=2.0, priority_score=1.0, scores={'sista_minuten': 1.0, 'planerare': 1.0},
+            )
+            for kind, item_id, title, due, end_time in rows
+        ]
+
+    dict_bytes = _allocated(as_dicts)
+    slot_bytes = _allocated(as_feed_items)
+    # Titlar och datum skapas i förväg och räknas inte; poäng-dictarna räknas i båda
+    print(f"{n:,} objekt: dict {dict_bytes / 1024:,.0f} KiB, FeedItem {slot_bytes / 1024:,.0f} KiB "
+          f"({slot_bytes / dict_bytes:.0%})")
+
+
+def _first_byte_and_total(client, url):
+    """(tid till första biten, total tid) för en GET, i sekunder."""
+    start = time.perf_counter()
+    response = client.get(url, buffered=False)
+    chunks = iter(response.response)
+    next(chunks, None)
+    first = time.perf_counter() - start
+    for _ in chunks:
+        pass
+    response.close()
+    return first, time.perf_counter() - start
+
+
+def _peak_memory(client, url):
+    """Högsta allokerade minnet (tracemalloc) under en hel GET."""
+    tracemalloc.start()
+    response = client.get(url, buffered=False)
+    for _ in response.response:
+        pass
+    response.close()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def bench_render(repeat=5):
+    """TTFB och toppminne för stora sidor, strömmade mot helt renderade i minnet."""
+    import perf_check
+
+    user_id = perf_check.seed_student('render@example.com', n_classes=6, n_subjects=10, n_assignments=5)
+    class_id = truetime.ClassMember.query.filter_by(user_id=user_id).first().class_id
+    client = truetime.app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = user_id
+
+    start = time.perf_counter()
+    truetime.app.jinja_env.from_string(truetime.DASH_TEMPLATE)
+    print(f"kompilering av DASH_TEMPLATE (render_template_string gjorde det varje gång): "
+          f"{(time.perf_counter() - start) * 1000:.1f} ms")
+
+    print("sida          läge        TTFB        total      toppminne")
+    for url in ('/', f'/class/{class_id}'):
+        for stream in (False, True):
+            truetime.app.config['STREAM_TEMPLATES'] = stream
+            client.get(url).get_data()  # värm mallcachen
+            ttfb, total = [], []
+            for _ in range(repeat):
+                # Kall översiktscache så att flödet räknas ut under renderingen
+                truetime.dashboard_cache.clear()
+                first, whole = _first_byte_and_total(client, url)
+                ttfb.append(first)
+                total.append(whole)
+            truetime.dashboard_cache.clear()
+            peak = _peak_memory(client, url)
+            label = 'strömmad' if stream else 'i minnet'
+            print(f"{url:<12}  {label:<9} {min(ttfb) * 1000:7.2f} ms  {min(total) * 1000:7.2f} ms  "
+                  f"{peak / 1024:8,.0f} KiB")
+    truetime.app.config['STREAM_TEMPLATES'] = True
+
+
+def bench_payload():
+    """Storlek på översikten (okomprimerad/gzip) och på fragmenten den hämtar vid behov."""
+    import perf_check
+
+    user_id = perf_check.seed_student('payload@example.com', n_classes=1, n_subjects=1, n_assignments=1)
+    truetime.db.session.get(truetime.User, user_id).has_seen_guide = True
+    truetime.db.session.commit()
+    client = truetime.app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = user_id
+
+    print("svar                          bytes       gzip")
+    for label, url in (('översikt (guiden sedd)', '/'),
+                       ('fragment: guide', '/fragments/guide'),
+                       ('fragment: studieplan', '/fragments/study-plan')):
+        body = client.get(url).get_data()
+        print(f"{label:<26} {len(body):>8,}  {len(gzip.compress(body)):>9,}")
+
+
+class _SmtpSinkHandler(socketserver.StreamRequestHandler):
+    """Minimal SMTP-server som tar emot och slänger allt."""
+
+    def handle(self):
+        # Motsvarar TLS-handskakning och AUTH mot en riktig server
+        time.sleep(self.server.connect_delay)
+        self.wfile.write(b'220 sink ESMTP\r\n')
+        for line in self.rfile:
+            command = line[:4].upper()
+            if command == b'EHLO':
+                self.wfile.write(b'250-sink\r\n250 8BITMIME\r\n')
+            elif command == b'DATA':
+                self.wfile.write(b'354 End data with <CR><LF>.<CR><LF>\r\n')
+                for data in self.rfile:
+                    if data == b'.\r\n':
+                        break
+                self.server.received += 1
+                self.wfile.write(b'250 OK\r\n')
+            elif command == b'QUIT':
+                self.wfile.write(b'221 Bye\r\n')
+                return
+            else:
+                self.wfile.write(b'250 OK\r\n')
+
+
+class SmtpSink(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, connect_delay=0.0):
+        super().__init__(('127.0.0.1', 0), _SmtpSinkHandler)
+        self.connect_delay = connect_delay
+        self.received = 0
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+
+def _use_smtp(port, max_emails):
+    app = truetime.app
+    app.config.update(MAIL_SERVER='127.0.0.1', MAIL_PORT=port, MAIL_USE_TLS=False, MAIL_USE_SSL=False,
+                      MAIL_USERNAME=None, MAIL_PASSWORD=None, MAIL_DEFAULT_SENDER='bench@example.com',
+                      MAIL_MAX_EMAILS=max_emails, MAIL_SUPPRESS_SEND=False)
+    truetime.mail.init_app(app)
+
+
+def bench_mail(n=300):
+    """Mejl per sekund mot en lokal SMTP-sänka: en anslutning per mejl mot en per batch."""
+    import perf_check
+
+    def messages():
+        return [truetime.Message(f'Påminnelse {i}', recipients=[f'elev{i}@example.com'], body='Hej!')
+                for i in range(n)]
+
+    def one_connection_each():
+        for msg in messages():
+            truetime.mail.send(msg)
+
+    def shared_connection():
+        with truetime.mail.connect() as connection:
+            for msg in messages():
+                truetime.send_over(connection, msg)
+
+    print("uppkoppling   per mejl         delad (max 100/anslutning)")
+    for delay in (0.0, 0.02):
+        sink = SmtpSink(connect_delay=delay)
+        _use_smtp(sink.server_address[1], max_emails=100)
+        rates = []
+        for send in (one_connection_each, shared_connection):
+            start = time.perf_counter()
+            send()
+            rates.append(n / (time.perf_counter() - start))
+        sink.shutdown()
+        print(f"{delay * 1000:5.0f} ms   {rates[0]:9,.0f} mejl/s   {rates[1]:9,.0f} mejl/s")
+
+    # Hela påminnelsekörningen via email_outbox, mot en sänka med 20 ms uppkoppling
+    sink = SmtpSink(connect_delay=0.02)
+    _use_smtp(sink.server_address[1], max_emails=100)
+    perf_check.seed_school(n_students=20, n_classes=3, n_subjects=5, n_assignments=10, n_activities=0)
+    start = time.perf_counter()
+    queued = truetime.send_deadline_notifications()
+    queue_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    sent = truetime.drain_outbox()
+    seconds = time.perf_counter() - start
+    sink.shutdown()
+    print(f"send_deadline_notifications(): {queued} påminnelser köade på {queue_seconds:.2f} s")
+    print(f"drain_outbox(): {sent} mejl på {seconds:.2f} s ({sent / seconds:,.0f} mejl/s), {sink.received} mottagna")
+
+
+BENCHMARKS = {
+    'scoring': bench_scoring,
+    'feed_items': bench_feed_items,
+    'render': bench_render,
+    'payload': bench_payload,
+    'mail': bench_mail,
+}
+
+
+if __name__ == '__main__':
+    names = sys.argv[1:] or list(BENCHMARKS)
+    with truetime.app.app_context():
+        truetime.db.create_all()
+        for name in names:
+            print(f"== {name} ==")
+            BENCHMARKS[name]()
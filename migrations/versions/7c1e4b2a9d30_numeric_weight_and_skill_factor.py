@@ -0,0 +1,69 @@
+"""Numeric subject weight and skill factor
+
+Revision ID: 7c1e4b2a9d30
+Revises: 049035dc4f6e
+Create Date: 2026-10-18 10:12:41.503218
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c1e4b2a9d30'
+down_revision = '049035dc4f6e'
+branch_labels = None
+depends_on = None
+
+# Samma mappningar som SUBJECT_WEIGHT_FACTORS / SKILL_FACTORS i app.py vid den här revisionen
+SUBJECT_WEIGHT_FACTORS = {'50p': 1, '100p': 2, '150p': 3, 'Gymnasiearbete': 4}
+DEFAULT_WEIGHT_FACTOR = 2.0
+SKILL_FACTORS = {'Låg': 3, 'Medel': 2, 'Hög': 1, 'Ej vald': 1.5}
+DEFAULT_SKILL_FACTOR = 1.5
+
+
+def _columns(table):
+    return {column['name'] for column in sa.inspect(op.get_bind()).get_columns(table)}
+
+
+def _factor_case(column, mapping, default):
+    return sa.case(
+        *[(column == key, float(value)) for key, value in mapping.items()],
+        else_=default
+    )
+
+
+def upgrade():
+    # Databaser skapade med db.create_all() efter den här ändringen har redan kolumnerna
+    if 'weight_factor' not in _columns('subjects'):
+        op.add_column('subjects', sa.Column('weight_factor', sa.Float(), nullable=False, server_default='2'))
+    if 'skill_factor' not in _columns('subject_skill'):
+        op.add_column('subject_skill', sa.Column('skill_factor', sa.Float(), nullable=False, server_default='1.5'))
+
+    subjects = sa.table('subjects', sa.column('id', sa.Integer), sa.column('weight', sa.String),
+                        sa.column('weight_factor', sa.Float))
+    op.execute(subjects.update().values(
+        weight_factor=_factor_case(subjects.c.weight, SUBJECT_WEIGHT_FACTORS, DEFAULT_WEIGHT_FACTOR)
+    ))
+
+    skills = sa.table('subject_skill', sa.column('level', sa.String), sa.column('skill_factor', sa.Float))
+    op.execute(skills.update().values(
+        skill_factor=_factor_case(skills.c.level, SKILL_FACTORS, DEFAULT_SKILL_FACTOR)
+    ))
+
+    # user_feed hade den fasta vikten 2.0 för alla uppgifter; hämta ämnets riktiga vikt
+    if sa.inspect(op.get_bind()).has_table('user_feed'):
+        feed = sa.table('user_feed', sa.column('kind', sa.String), sa.column('subject_id', sa.Integer),
+                        sa.column('weight', sa.Float))
+        op.execute(feed.update().where(feed.c.kind == 'assignment').values(
+            weight=sa.select(subjects.c.weight_factor)
+            .where(subjects.c.id == feed.c.subject_id)
+            .scalar_subquery()
+        ))
+
+
+def downgrade():
+    with op.batch_alter_table('subject_skill') as batch_op:
+        batch_op.drop_column('skill_factor')
+    with op.batch_alter_table('subjects') as batch_op:
+        batch_op.drop_column('weight_factor')
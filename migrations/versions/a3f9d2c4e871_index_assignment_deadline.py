@@ -0,0 +1,27 @@
+"""Index assignments.deadline
+
+Revision ID: a3f9d2c4e871
+Revises: 7c1e4b2a9d30
+Create Date: 2026-10-18 11:02:17.284551
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3f9d2c4e871'
+down_revision = '7c1e4b2a9d30'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Databaser skapade med db.create_all() efter den här ändringen har redan indexet
+    indexes = {index['name'] for index in sa.inspect(op.get_bind()).get_indexes('assignments')}
+    if 'ix_assignments_deadline' not in indexes:
+        op.create_index('ix_assignments_deadline', 'assignments', ['deadline'])
+
+
+def downgrade():
+    op.drop_index('ix_assignments_deadline', table_name='assignments')
@@ -0,0 +1,59 @@
+"""Persisted next_notify_at for deadline reminders
+
+Revision ID: e5b7c0d19f42
+Revises: a3f9d2c4e871
+Create Date: 2026-10-18 11:48:05.913377
+
+"""
+from datetime import datetime, timedelta
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5b7c0d19f42'
+down_revision = 'a3f9d2c4e871'
+branch_labels = None
+depends_on = None
+
+# Samma som NOTIFICATION_THRESHOLDS / next_notify_at() i app.py vid den här revisionen
+NOTIFICATION_THRESHOLDS = (14, 7, 3, 1)
+
+
+def next_notify_at(deadline, now):
+    for days in NOTIFICATION_THRESHOLDS:
+        if deadline - timedelta(days=days) >= now:
+            return deadline - timedelta(days=days + 1)
+    return None
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    # Databaser skapade med db.create_all() efter den här ändringen har redan kolumnen
+    if 'next_notify_at' not in {column['name'] for column in inspector.get_columns('assignments')}:
+        op.add_column('assignments', sa.Column('next_notify_at', sa.DateTime(), nullable=True))
+    if 'ix_assignments_next_notify_at' not in {index['name'] for index in inspector.get_indexes('assignments')}:
+        op.create_index('ix_assignments_next_notify_at', 'assignments', ['next_notify_at'])
+
+    # Bara uppgifter med deadline fram till och med 15 dagar bort kan få fler påminnelser
+    assignments = sa.table('assignments', sa.column('id', sa.Integer), sa.column('deadline', sa.DateTime),
+                           sa.column('next_notify_at', sa.DateTime))
+    now = datetime.now()
+    rows = bind.execute(
+        sa.select(assignments.c.id, assignments.c.deadline).where(assignments.c.deadline >= now)
+    ).all()
+    updates = [{'row_id': row.id, 'next_notify_at': next_notify_at(row.deadline, now)} for row in rows]
+    if updates:
+        bind.execute(
+            assignments.update().where(assignments.c.id == sa.bindparam('row_id'))
+            .values(next_notify_at=sa.bindparam('next_notify_at')),
+            updates
+        )
+
+
+def downgrade():
+    op.drop_index('ix_assignments_next_notify_at', table_name='assignments')
+    with op.batch_alter_table('assignments') as batch_op:
+        batch_op.drop_column('next_notify_at')
@@ -1,8 +1,56 @@
-from app import app, db
-from app import send_deadline_notifications
+"""Påminnelser och utskick från email_outbox, utanför webbprocesserna.
+
+    python notify_worker.py          # en körning: rensa, köa påminnelser och skicka allt som väntar (cron)
+    python notify_worker.py --loop   # egen process som skickar löpande och kör de schemalagda jobben
+
+Flera workers kan köras samtidigt; de gör anspråk på olika rader i
+email_outbox (FOR UPDATE SKIP LOCKED på Postgres, lease på SQLite).
+"""
+import sys
+import time
+
+from app import app, db, scheduler
+from app import send_deadline_notifications, drain_outbox, prune_outbox
+from app import purge_expired_assignments, archive_past_activities, prune_feed_changes
+
+
+def run_once():
+    print("Running scheduled notification check...")
+    # Utan --loop körs ingen schemaläggare, så cron-körningen sköter rensningen
+    purge_expired_assignments()
+    if app.config['ACTIVITY_RETENTION_DAYS']:
+        archive_past_activities()
+    prune_feed_changes()
+    queued = send_deadline_notifications()
+    sent = drain_outbox()
+    print(f"Done. {queued} reminders queued, {sent} emails sent.")
+
+
+def run_loop():
+    print("Outbox worker started.")
+    # Rensning och arkivering körs här i stället för i varje webbworker
+    if not scheduler.running:
+        scheduler.start()
+    next_notify = 0
+    while True:
+        try:
+            if time.monotonic() >= next_notify:
+                send_deadline_notifications()
+                prune_outbox()
+                next_notify = time.monotonic() + app.config['NOTIFY_INTERVAL_SECONDS']
+            if not drain_outbox():
+                time.sleep(app.config['EMAIL_OUTBOX_POLL_INTERVAL'])
+        except Exception as e:
+            # Databasen eller SMTP-servern kan vara borta en stund; försök igen
+            db.session.rollback()
+            print(f"Worker error: {e}")
+            time.sleep(app.config['EMAIL_OUTBOX_POLL_INTERVAL'])
+
 
 # Create an application context so DB / Mail / config work
 with app.app_context():
-    print("Running scheduled notification check...")
-    send_deadline_notifications()
-    print("Done.")
+    db.create_all()
+    if '--loop' in sys.argv[1:]:
+        run_loop()
+    else:
+        run_once()
@@ -0,0 +1,221 @@
+"""Kontrollerar att översikten kör ett fast antal SQL-satser och håller sina budgetar.
+
+Körs mot en egen databas i minnet (aldrig DATABASE_URL):
+
+    python perf_check.py
+
+Budgetarna i BUDGETS kan skrivas över per sida, t.ex.
+PERF_BUDGET_INDEX_STATEMENTS=12 eller PERF_BUDGET_VIEW_CLASS_MS=200.
+"""
+import os
+import statistics
+import sys
+import time
+
+os.environ['DATABASE_URL'] = os.environ.get('PERF_CHECK_DATABASE_URL', 'sqlite://')
+os.environ.setdefault('GROQ_API_KEY', 'perf-check')
+
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+from app import (app, db, User, Class, ClassMember, Subject, Assignment, Activity, SubjectSkill, sync_user_feed,
+                 rebuild_user_feed, dashboard_cache, next_notify_at)
+
+# Högsta antal SQL-satser och millisekunder (median, kall cache) per sida med seed_school()
+BUDGETS = {
+    'index': {'statements': 9, 'ms': 100},
+    'view_class': {'statements': 10, 'ms': 60},
+    'view_subject': {'statements': 10, 'ms': 60},
+}
+
+
+@contextmanager
+def count_queries():
+    """Räknar SQL-satser som skickas till databasen inom blocket."""
+    counter = {'count': 0}
+
+    def _before_execute(conn, cursor, statement, parameters, context, executemany):
+        counter['count'] += 1
+
+    event.listen(db.engine, 'before_cursor_execute', _before_execute)
+    try:
+        yield counter
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', _before_execute)
+
+
+def seed_student(email, n_classes, n_subjects, n_assignments, n_activities=3):
+    """Skapar en elev med n_classes klasser à n_subjects ämnen à n_assignments uppgifter."""
+    now = datetime.now()
+    user = User(name=email.split('@')[0], email=email, password_hash='x', confirmed=True)
+    db.session.add(user)
+    db.session.flush()
+
+    for c in range(n_classes):
+        cls = Class(name=f'{email}-klass-{c}', join_code=f'{user.id:03d}{c:03d}', admin_user_id=user.id)
+        db.session.add(cls)
+        db.session.flush()
+        db.session.add(ClassMember(user_id=user.id, class_id=cls.id, role='admin' if c == 0 else 'member'))
+        for s in range(n_subjects):
+            subj = Subject(class_id=cls.id, name=f'Ämne {c}-{s}', weight='100p', weight_factor=2.0)
+            db.session.add(subj)
+            db.session.flush()
+            db.session.add(SubjectSkill(user_id=user.id, subject_id=subj.id, level='Medel', skill_factor=2.0))
+            for a in range(n_assignments):
+                db.session.add(Assignment(
+                    subject_id=subj.id,
+                    title=f'Uppgift {c}-{s}-{a}',
+                    type='assignment' if a % 2 else 'exam',
+                    deadline=now + timedelta(days=1 + a, hours=c + s),
+                    created_by=user.id,
+                ))
+
+    for i in range(n_activities):
+        db.session.add(Activity(
+            user_id=user.id,
+            name=f'Aktivitet {i}',
+            start_time=now + timedelta(days=i + 1),
+            end_time=now + timedelta(days=i + 1, hours=2),
+        ))
+
+    sync_user_feed(user_id=user.id)
+    db.session.commit()
+    return user.id
+
+
+def seed_school(n_students=30, n_classes=4, n_subjects=12, n_assignments=10, n_activities=8):
+    """Skapar en skola där alla elever går i alla klasser. Returnerar (elev-id:n, klass-id:n).
+
+    Standardvärdena ger 48 ämnen, 480 uppgifter och 240 aktiviteter,
+    d.v.s. ungefär 15 000 user_feed-rader.
+    """
+    now = datetime.now()
+    students = [User(name=f'elev{i}', email=f'elev{i}@skola.example.com', password_hash='x', confirmed=True)
+                for i in range(n_students)]
+    db.session.add_all(students)
+    db.session.flush()
+
+    class_ids = []
+    for c in range(n_classes):
+        cls = Class(name=f'Skolklass {c}', join_code=f'S{c:05d}', admin_user_id=students[0].id)
+        db.session.add(cls)
+        db.session.flush()
+        class_ids.append(cls.id)
+        for i, student in enumerate(students):
+            db.session.add(ClassMember(user_id=student.id, class_id=cls.id, role='admin' if i == 0 else 'member'))
+        for s in range(n_subjects):
+            subj = Subject(class_id=cls.id, name=f'Kurs {c}-{s}', weight='100p', weight_factor=2.0)
+            db.session.add(subj)
+            db.session.flush()
+            for i, student in enumerate(students):
+                if (i + s) % 3 == 0:
+                    db.session.add(SubjectSkill(user_id=student.id, subject_id=subj.id, level='Låg', skill_factor=3.0))
+            for a in range(n_assignments):
+                deadline = now + timedelta(days=a * 3 - 2, hours=c + s)
+                db.session.add(Assignment(
+                    subject_id=subj.id,
+                    title=f'Uppgift {c}-{s}-{a}',
+                    type='exam' if a % 4 == 0 else 'assignment',
+                    deadline=deadline,
+                    created_by=students[0].id,
+                    next_notify_at=next_notify_at(deadline, now),
+                ))
+
+    for student in students:
+        for i in range(n_activities):
+            db.session.add(Activity(
+                user_id=student.id,
+                name=f'Aktivitet {i}',
+                start_time=now + timedelta(days=i * 2 - 1),
+                end_time=now + timedelta(days=i * 2 - 1, hours=2),
+            ))
+
+    db.session.commit()
+    rebuild_user_feed()
+    return [student.id for student in students], class_ids
+
+
+def measure_page(client, url, repeat=5):
+    """(SQL-satser, median-ms) för en GET med kall översiktscache, inklusive strömmad body."""
+    timings, statements = [], None
+    for _ in range(repeat):
+        dashboard_cache.clear()
+        with count_queries() as counter:
+            start = time.perf_counter()
+            response = client.get(url)
+            response.get_data()
+            timings.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200, (url, response.status_code)
+        statements = counter['count'] if statements is None else max(statements, counter['count'])
+    return statements, statistics.median(timings)
+
+
+def budget(name):
+    """BUDGETS[name] med eventuella PERF_BUDGET_<NAME>_STATEMENTS/_MS från miljön."""
+    limits = dict(BUDGETS[name])
+    for key in limits:
+        override = os.environ.get(f'PERF_BUDGET_{name.upper()}_{key.upper()}')
+        if override:
+            limits[key] = float(override) if key == 'ms' else int(override)
+    return limits
+
+
+def check_budget(name, client, url):
+    """Mäter url och jämför med budget(name). Returnerar True om den hålls."""
+    limits = budget(name)
+    statements, ms = measure_page(client, url)
+    ok = statements <= limits['statements'] and ms <= limits['ms']
+    print(f"{name}: {statements} satser (budget {limits['statements']}), "
+          f"{ms:.1f} ms (budget {limits['ms']:.0f} ms) {'OK' if ok else 'ÖVER BUDGET'}")
+    return ok
+
+
+def check_page_budgets():
+    """Översikten, en klassida och en ämnessida för en elev i en hel skola."""
+    student_ids, class_ids = seed_school()
+    subject_id = Subject.query.filter_by(class_id=class_ids[0]).first().id
+
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = student_ids[len(student_ids) // 2]
+
+    results = [
+        check_budget('index', client, '/'),
+        check_budget('view_class', client, f'/class/{class_ids[0]}'),
+        check_budget('view_subject', client, f'/subject/{subject_id}'),
+    ]
+    return all(results)
+
+
+def dashboard_query_count(client, user_id):
+    with client.session_transaction() as sess:
+        sess['user_id'] = user_id
+
+    with count_queries() as counter:
+        response = client.get('/')
+        response.get_data()  # strömmade sidor renderas först när bodyn läses
+    assert response.status_code == 200, response.status_code
+    return counter['count']
+
+
+def check_dashboard_query_count():
+    """Antalet satser får inte växa med antal klasser/ämnen."""
+    small = seed_student('liten@example.com', n_classes=1, n_subjects=1, n_assignments=1)
+    large = seed_student('stor@example.com', n_classes=6, n_subjects=10, n_assignments=5)
+
+    client = app.test_client()
+    small_count = dashboard_query_count(client, small)
+    large_count = dashboard_query_count(client, large)
+
+    print(f"index(): {small_count} satser (1 klass/1 ämne), {large_count} satser (6 klasser/60 ämnen)")
+    return small_count == large_count
+
+
+if __name__ == '__main__':
+    with app.app_context():
+        db.create_all()
+        ok = check_dashboard_query_count()
+        ok = check_page_budgets() and ok
+    sys.exit(0 if ok else 1)
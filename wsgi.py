@@ -1,10 +1,19 @@
 from app import app, db
+from app import UserFeedItem, rebuild_user_feed
 import os
 
 # Skapa databasen om den inte finns
 with app.app_context():
     db.create_all()
 
+    # Första starten efter att user_feed lades till: fyll tabellen
+    try:
+        if UserFeedItem.query.first() is None:
+            rebuild_user_feed()
+    except Exception:
+        # En annan worker hann före
+        db.session.rollback()
+
 # Det här behövs för att Gunicorn/Render ska hitta "application"
 application = app 
 